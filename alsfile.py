@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import copy
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import xmlbackend
+from contextlib import contextmanager
+
+# An .als file is a gzipped XML document. Plain XML is still accepted
+# so that the tests and any hand-decompressed sets keep working.
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Same level as the gzip command line tool that used to produce the output
+COMPRESS_LEVEL = 6
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def is_gzipped(filename):
+    with open(filename, 'rb') as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def open_for_reading(filename):
+    """
+    Returns a binary file object yielding the decompressed
+    XML of the set, whether or not it is gzipped on disk
+    """
+    if is_gzipped(filename):
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def open_for_writing(filename, compress):
+    """
+    Returns a binary file object that the XML of the set
+    can be written into, compressing it on the fly if asked
+    """
+    if compress:
+        return gzip.open(filename, 'wb', compresslevel=COMPRESS_LEVEL)
+    return open(filename, 'wb')
+
+
+@contextmanager
+def replacing(filename):
+    """
+    Yields the path of a temporary file next to filename, which is
+    moved over filename if the block succeeds and removed otherwise,
+    so that filename can be read while its replacement is written
+    """
+    folder = os.path.dirname(filename) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    os.close(fd)
+    try:
+        yield temp_path
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp_path)
+        os.replace(temp_path, filename)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def content_digest(filename):
+    """
+    SHA-1 of the decompressed XML of the set, the same for a
+    set however it was gzipped
+    """
+    h = hashlib.sha1()
+    with open_for_reading(filename) as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def parse(filename):
+    """
+    Parses a set, keeping only its root element
+    """
+    with open_for_reading(filename) as f:
+        return xmlbackend.parse(f)
+
+
+def load_roots(*filenames):
+    """
+    Parses each distinct file exactly once and returns the
+    root elements in the order the files were given.
+
+    The first root is merged into in place, so a file that is
+    passed more than once is handed out as a copy rather than
+    sharing elements with the merge output
+    """
+    parsed = {}
+    roots = []
+    for filename in filenames:
+        key = os.path.realpath(filename)
+        if key in parsed:
+            roots.append(copy.deepcopy(parsed[key]))
+        else:
+            parsed[key] = parse(filename)
+            roots.append(parsed[key])
+    return roots
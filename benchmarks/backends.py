@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Times the driver with each of the backends in xmlbackend.py that is
+installed: loading the sets as a merge does, the whole merge through
+merge.run, and the tree operations it depends on. The test_data sets
+are used unless a base, ours and theirs are given, which should be
+large for the parsing to show.
+
+    python benchmarks/backends.py [--repeat N] [BASE OURS THEIRS]
+
+Each backend is measured in its own process, as the backend is
+chosen when xmlbackend is first imported
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(CODE_DIR)
+
+SETS = [
+    'test_data/test_version_1_A.xml',
+    'test_data/test_version_2_A.xml',
+    'test_data/test_version_2_B.xml',
+]
+
+
+def best_of(repeat, function):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def measure(repeat, paths):
+    import xmlbackend
+    import alsfile
+    import loader
+    import merge
+    from version import COLLIDABLE_TAGS
+
+    roots = [alsfile.parse(p) for p in paths]
+    temp_dir = tempfile.mkdtemp()
+    output = os.path.join(temp_dir, 'out' + os.path.splitext(paths[1])[1])
+
+    def load():
+        for version in loader.load_versions(paths, stream=True):
+            version.close()
+
+    try:
+        return {
+            'backend': xmlbackend.NAME,
+            'load': best_of(repeat, load),
+            'run': best_of(repeat, lambda: merge.run(paths + [output])),
+            'deepcopy': best_of(repeat, lambda: [copy.deepcopy(r) for r in roots]),
+            'tostring': best_of(repeat, lambda: [xmlbackend.ET.tostring(r) for r in roots]),
+            'iter_tags': best_of(repeat, lambda: [list(xmlbackend.iter_tags(r, COLLIDABLE_TAGS)) for r in roots]),
+        }
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def available_backends():
+    import importlib.util
+    backends = ['etree']
+    if importlib.util.find_spec('lxml') is not None:
+        backends.append('lxml')
+    return backends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('sets', nargs='*', metavar='SET', help='base, ours and theirs')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.sets and len(args.sets) != 3:
+        parser.error('give a base, ours and theirs, or none')
+    paths = [os.path.abspath(s) for s in args.sets] or [os.path.join(CODE_DIR, s) for s in SETS]
+
+    if args.child:
+        json.dump(measure(args.repeat, paths), sys.stdout)
+        return
+
+    results = []
+    for backend in available_backends():
+        env = dict(os.environ, ALS_MERGE_XML=backend)
+        output = subprocess.check_output(
+            [sys.executable, __file__, '--child', '--repeat', str(args.repeat)] + paths, env=env, cwd=CODE_DIR
+        )
+        results.append(json.loads(output))
+
+    columns = ['load', 'run', 'deepcopy', 'tostring', 'iter_tags']
+    print('%-8s' % 'backend' + ''.join('%11s' % c for c in columns))
+    for result in results:
+        print('%-8s' % result['backend'] + ''.join('%10.3fs' % result[c] for c in columns))
+
+
+if __name__ == '__main__':
+    main()
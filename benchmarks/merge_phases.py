@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Times each phase of merge.run on synthetic sets of growing size
+(see synthetic.py), from the merge's own trace (see tracing.py),
+writing the results as JSON.
+
+    python benchmarks/merge_phases.py --scale 1 2 4 8 --output results.json
+
+The numbers of tracks and of changed and added tracks are multiplied
+by each scale in turn. Compare the output of two runs to catch phases
+that stop scaling linearly
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCHMARK_DIR)
+
+import synthetic
+import xmlbackend
+import sends
+import merge
+
+# Phases of the trace reported under each name
+PHASES = OrderedDict([
+    ('parse', ['fast_path', 'load']),
+    ('diff', ['ensure_id_index', 'added_removed', 'updated']),
+    ('conflict', ['merge_tracks', 'resolve_conflicts']),
+    ('apply', ['apply']),
+    ('sends', ['move_return_tracks_to_end', 'reconcile_send_values', 'generate_sends', 'amend_sends_pre']),
+    ('ids', ['amend_track_collisions', 'amend_global_id_collisions']),
+    ('write', ['write']),
+])
+
+
+def run_once(paths):
+    """
+    Merges a copy of the triple at paths with tracing on, returning
+    the time of each phase, the total and the peak RSS
+    """
+    folder = tempfile.mkdtemp()
+    try:
+        base, ours, theirs = [shutil.copy(p, folder) for p in paths]
+        trace_file = os.path.join(folder, 'trace.jsonl')
+        merge.run([base, ours, theirs, ours, '--trace-file', trace_file])
+        with open(trace_file) as f:
+            trace = json.loads(f.read())
+    finally:
+        shutil.rmtree(folder)
+
+    seconds = {phase['name']: phase['seconds'] for phase in trace['phases']}
+    result = OrderedDict(
+        (name, sum(seconds.get(p, 0.0) for p in phases)) for name, phases in PHASES.items()
+    )
+    # Less the time spent tracing
+    total = trace['seconds'] - trace['overhead']
+    result['other'] = total - sum(result.values())
+    result['total'] = total
+    result['peak_rss'] = trace['peak_rss']
+    return result
+
+
+def benchmark(size, changes, repeat):
+    folder = tempfile.mkdtemp()
+    try:
+        paths = synthetic.write_triple(folder, size, changes)
+        runs = [run_once(paths) for _ in range(repeat)]
+        return OrderedDict([
+            ('size', size._asdict()),
+            ('changes', changes._asdict()),
+            ('bytes', os.path.getsize(paths[0])),
+            # Best of the runs for each phase
+            ('phases', OrderedDict((phase, min(r[phase] for r in runs)) for phase in PHASES)),
+            ('total', min(r['total'] for r in runs)),
+            ('other', min(r['other'] for r in runs)),
+            ('peak_rss', max(r['peak_rss'] or 0 for r in runs)),
+        ])
+    finally:
+        shutil.rmtree(folder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--midi', type=int, default=8)
+    parser.add_argument('--audio', type=int, default=4)
+    parser.add_argument('--returns', type=int, default=2)
+    parser.add_argument('--devices', type=int, default=2, help='effects on each track')
+    parser.add_argument('--clips', type=int, default=4, help='clips on each MIDI track')
+    parser.add_argument('--changed', type=int, default=2, help='tracks changed in only one branch, per branch')
+    parser.add_argument('--both-changed', type=int, default=1, help='tracks changed in both branches')
+    parser.add_argument('--added', type=int, default=1, help='tracks added in each branch')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file for the results, printed if not given')
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scale:
+        size = synthetic.SetSize(
+            args.midi * scale, args.audio * scale, args.returns, args.devices, args.clips
+        )
+        changes = synthetic.BranchChanges(
+            args.changed * scale, args.both_changed * scale, args.added * scale
+        )
+        result = benchmark(size, changes, args.repeat)
+        result['scale'] = scale
+        result['sends_backend'] = sends.backend_name((size.midi + size.audio + size.returns) * size.returns)
+        results.append(result)
+        sys.stderr.write('scale %d: %.3fs\n' % (scale, result['total']))
+
+    report = OrderedDict([
+        ('python', platform.python_version()),
+        ('xml_backend', xmlbackend.NAME),
+        ('results', results),
+    ])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Times the cold start of merge.py, as git runs it for every set,
+and fails if importing the driver takes longer than the budget.
+
+    python benchmarks/startup.py [--budget SECONDS] [--repeat N]
+
+Reports the best of the runs of a bare interpreter, of importing
+merge.py and of a merge of a set with itself, which takes the fast
+path. The budget is for the import, less the bare interpreter
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SET = os.path.join(CODE_DIR, 'test_data', 'test_version_1_A.xml')
+
+# Seconds
+DEFAULT_BUDGET = 0.1
+
+
+def best_of(repeat, args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable] + args, cwd=CODE_DIR)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, metavar='SECONDS')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        output = os.path.join(folder, 'out.xml')
+        shutil.copy(SET, output)
+        results = {
+            'interpreter': best_of(args.repeat, ['-c', 'pass']),
+            'import': best_of(args.repeat, ['-c', 'import merge']),
+            'trivial_merge': best_of(args.repeat, ['merge.py', SET, output, SET, output]),
+        }
+    finally:
+        shutil.rmtree(folder)
+
+    results['import_less_interpreter'] = results['import'] - results['interpreter']
+    results['budget'] = args.budget
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+    if results['import_less_interpreter'] > args.budget:
+        sys.stderr.write('Importing merge.py took %.3fs, over the budget of %.3fs\n' % (
+            results['import_less_interpreter'], args.budget
+        ))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
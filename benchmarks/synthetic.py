@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic base/ours/theirs sets of any size for the benchmarks.
+
+The sets start from blank.xml, with tracks, devices and clips copied
+from test_data/test_version_1_A.xml. The branches each change their
+own tracks, change some of the same tracks in different places and
+add tracks, so a merge goes through every phase without conflicts.
+
+Changes are to the structure of the tracks, adding devices and moving
+clips, since changed values of leaf elements alone are not told apart
+by tree_equal
+"""
+import copy
+import os
+import sys
+from collections import namedtuple
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(CODE_DIR)
+
+import alsfile
+from version import Version, TrackType
+
+BLANK = os.path.join(CODE_DIR, 'blank.xml')
+SOURCE = os.path.join(CODE_DIR, 'test_data', 'test_version_1_A.xml')
+
+# Tracks in SOURCE used as templates
+MIDI_TEMPLATE_ID = '13'
+AUDIO_TEMPLATE_ID = '8'
+RETURN_TEMPLATE_ID = '2'
+
+# Gap between clips in the arrangement, in beats
+CLIP_SPACING = 16
+
+SetSize = namedtuple('SetSize', ['midi', 'audio', 'returns', 'devices', 'clips'])
+
+# Tracks changed only in ours and only in theirs, changed in both,
+# and added in each branch
+BranchChanges = namedtuple('BranchChanges', ['changed', 'both_changed', 'added'])
+
+
+class Templates():
+
+    def __init__(self):
+        source = alsfile.parse(SOURCE)
+        tracks = {t.attrib['Id']: t for t in source.find('LiveSet').find('Tracks')}
+        self.blank = alsfile.parse(BLANK)
+        self.tracks = {
+            TrackType.MIDI: tracks[MIDI_TEMPLATE_ID],
+            TrackType.AUDIO: tracks[AUDIO_TEMPLATE_ID],
+            TrackType.RETURN: tracks[RETURN_TEMPLATE_ID],
+        }
+        # Audio effects, which go on any type of track
+        self.devices = [
+            device for track in tracks.values() if track.tag != 'MidiTrack'
+                for device in track.find('DeviceChain').find('DeviceChain').find('Devices')
+        ]
+        self.clip = next(self.tracks[TrackType.MIDI].iter('MidiClip'))
+
+    def track(self, type_, id_, size):
+        track = copy.deepcopy(self.tracks[type_])
+        track.attrib['Id'] = str(id_)
+        track.find('Name').find('EffectiveName').attrib['Value'] = '%s %d' % (type_.name.title(), id_)
+        track.find('Name').find('UserName').attrib['Value'] = ''
+
+        # MIDI tracks keep their instrument in front of the effects
+        devices = track.find('DeviceChain').find('DeviceChain').find('Devices')
+        devices[:] = list(devices)[:1] if type_ == TrackType.MIDI else []
+        devices.extend(
+            copy.deepcopy(self.devices[i % len(self.devices)]) for i in range(size.devices)
+        )
+        for i, device in enumerate(devices):
+            device.attrib['Id'] = str(i)
+
+        # Only MIDI clips, audio clips would need samples
+        if type_ == TrackType.MIDI:
+            events = track.find('DeviceChain/MainSequencer/ClipTimeable/ArrangerAutomation/Events')
+            events[:] = [copy.deepcopy(self.clip) for _ in range(size.clips)]
+            for i, clip in enumerate(events):
+                clip.attrib['Id'] = str(i)
+                clip.attrib['Time'] = str(i * CLIP_SPACING)
+
+        # Filled in by finish()
+        del track.find('DeviceChain').find('Mixer').find('Sends')[:]
+        return track
+
+
+def make_base(size, templates=None):
+    """
+    Returns the root of a set with the given numbers of tracks,
+    devices on each track and clips on each MIDI track
+    """
+    templates = templates or Templates()
+    root = copy.deepcopy(templates.blank)
+    live_set = root.find('LiveSet')
+    del live_set.find('Tracks')[:]
+    del live_set.find('SendsPre')[:]
+
+    types = (
+        [TrackType.MIDI] * size.midi + [TrackType.AUDIO] * size.audio + [TrackType.RETURN] * size.returns
+    )
+    for id_, type_ in enumerate(types, start=1):
+        live_set.find('Tracks').append(templates.track(type_, id_, size))
+    return finish(root, lambda track, i: 0.5)
+
+
+def make_branch(base, side, changes, size, templates=None):
+    """
+    Returns a copy of base changed on one side, 'ours' or 'theirs'
+    """
+    templates = templates or Templates()
+    root = copy.deepcopy(base)
+    tracks = [t for t in root.find('LiveSet').find('Tracks') if t.tag != 'ReturnTrack']
+
+    # Each side changes its own tracks from either end of the set
+    own = tracks[:changes.changed] if side == 'ours' else tracks[::-1][:changes.changed]
+    for track in own:
+        add_device(track, templates)
+
+    # and different parts of the same MIDI tracks in the middle
+    midi_tracks = [t for t in tracks if t.tag == 'MidiTrack']
+    middle = len(midi_tracks) // 2
+    for track in midi_tracks[middle:middle + changes.both_changed]:
+        if side == 'ours':
+            add_device(track, templates)
+        else:
+            move_clips(track, CLIP_SPACING // 2)
+
+    # Added tracks get the same ids in both branches, as in Live
+    next_id = max(int(t.attrib['Id']) for t in root.find('LiveSet').find('Tracks')) + 1
+    tracks_elem = root.find('LiveSet').find('Tracks')
+    for id_ in range(next_id, next_id + changes.added):
+        tracks_elem.insert(len(tracks), templates.track(TrackType.MIDI, id_, size))
+
+    # Sends of the tracks changed on this side move too
+    changed_ids = {t.attrib['Id'] for t in own}
+    return finish(root, lambda track, i: 0.75 if str(track.track_id) in changed_ids else None)
+
+
+def add_device(track, templates):
+    devices = track.find('DeviceChain').find('DeviceChain').find('Devices')
+    device = copy.deepcopy(templates.devices[0])
+    device.attrib['Id'] = str(len(devices))
+    devices.append(device)
+
+
+def move_clips(track, beats):
+    for clip in track.iter('MidiClip'):
+        clip.attrib['Time'] = str(int(clip.attrib['Time']) + beats)
+
+
+def finish(root, send_value):
+    """
+    Fills in the sends of every track, keeping any it has unless
+    send_value(track, return_index) gives a value, and makes the
+    ids unique, with the driver's own code
+    """
+    version = Version(root)
+    returns = version.get_return_tracks()
+    for track in version.tracks:
+        for i, rt in enumerate(returns):
+            value = send_value(track, i)
+            if value is not None or rt.track_id not in track.return_map:
+                track.return_map[rt.track_id] = value if value is not None else 0.5
+    version.reconcile_send_values()
+    version.generate_sends()
+    version.amend_global_id_collisions()
+    version.amend_sends_pre()
+    return root
+
+
+def write_triple(folder, size, changes, compress=True):
+    """
+    Writes base.als, ours.als and theirs.als into folder,
+    returning their paths
+    """
+    templates = Templates()
+    base = make_base(size, templates)
+    roots = [
+        base,
+        make_branch(base, 'ours', changes, size, templates),
+        make_branch(base, 'theirs', changes, size, templates),
+    ]
+    paths = []
+    for name, root in zip(['base', 'ours', 'theirs'], roots):
+        path = os.path.join(folder, name + '.als')
+        Version(root).write(path, compress=compress)
+        paths.append(path)
+    return paths
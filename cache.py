@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from version import SUMMARY_FORMAT
+
+CACHE_DIR = '.merge/cache'
+
+# Least recently used entries are evicted beyond this total size
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# Summaries kept by a MemoryCache
+MAX_MEMORY_ENTRIES = 64
+
+
+def blob_key(filename):
+    # Hash of the file as it is on disk, with the format of the summary
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return 'v' + str(SUMMARY_FORMAT) + '-' + h.hexdigest()
+
+
+class SummaryCache():
+    """
+    On-disk cache of the VersionSummary of each set that has been
+    loaded, keyed by the hash of its blob, so that the tracks of the
+    same base handed to the driver again during a rebase are not
+    fingerprinted again. Sets that were read through by a StreamedSet
+    are then only decompressed, while those parsed whole still are
+    """
+
+    def __init__(self, folder=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def key(self, filename):
+        return blob_key(filename)
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.pickle')
+
+    def contains(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                summary = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Unreadable, e.g. written by an older version of the driver
+            # without a change to SUMMARY_FORMAT
+            os.remove(path)
+            return None
+
+        # Mark as recently used
+        os.utime(path)
+        return summary
+
+    def put(self, key, summary):
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+        # Write to a temporary file first so that a concurrent
+        # reader never sees a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(summary, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path(key))
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            if not name.endswith('.pickle'):
+                continue
+            stat = os.stat(os.path.join(self.folder, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.folder, name))
+            total -= size
+
+
+class MemoryCache():
+    """
+    Keeps the summaries of the sets loaded most recently in memory,
+    for a process that merges many times such as daemon.py, in front
+    of an optional SummaryCache given as backing. Summaries are kept
+    pickled, so that each load gets its own copy to change
+    """
+
+    def __init__(self, backing=None, max_entries=MAX_MEMORY_ENTRIES):
+        self.backing = backing
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def key(self, filename):
+        return blob_key(filename)
+
+    def contains(self, key):
+        return key in self.entries or (self.backing is not None and self.backing.contains(key))
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return pickle.loads(self.entries[key])
+        if self.backing is None:
+            return None
+        summary = self.backing.get(key)
+        if summary is not None:
+            self.remember(key, summary)
+        return summary
+
+    def put(self, key, summary):
+        self.remember(key, summary)
+        if self.backing is not None:
+            self.backing.put(key, summary)
+
+    def remember(self, key, summary):
+        self.entries[key] = pickle.dumps(summary, protocol=pickle.HIGHEST_PROTOCOL)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
@@ -1,19 +1,34 @@
-import xml.etree.ElementTree as ET
+from xmlbackend import ET, shallow_copy
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
+import alsfile
+
+BLANK_TEMPLATE = '.merge/blank.xml'
+
+# Parsed templates by path, with the time each was modified, kept
+# for as long as the process runs, which for daemon.py is many merges
+_templates = {}
 
 class Conflict():
 
-    def __init__(self, base, ours, theirs):
+    # base, ours and theirs are the conflicting track elements,
+    # differences maps 'ours' and 'theirs' to the list of
+    # equal.Differences of that branch's track from base
+    def __init__(self, base, ours, theirs, differences=None):
         self.base = base
         self.ours = ours
         self.theirs = theirs
+        self.differences = differences or {'ours': [], 'theirs': []}
 
     def write(self, folder, filename):
         data = {
-            "base": self.base,
-            "ours": self.ours,
-            "theirs": self.theirs,
+            "base": ET.tostring(self.base).decode(),
+            "ours": ET.tostring(self.ours).decode(),
+            "theirs": ET.tostring(self.theirs).decode(),
+            "differences": {
+                side: [d._asdict() for d in differences] for side, differences in self.differences.items()
+            },
         }
 
         if not os.path.exists(folder):
@@ -24,3 +39,99 @@ class Conflict():
 
         with open('done', 'w') as f:
             pass
+
+
+class PreviewBuilder():
+    """
+    Builds the sample projects that show each side of a Conflict
+    to the resolver, starting from the blank project template.
+
+    The template is parsed once per process. Each preview is a copy of only the
+    elements that differ from it, the rest of the tree is shared, so
+    previews must be written out rather than changed further
+    """
+
+    def __init__(self, template_filename=BLANK_TEMPLATE):
+        self.template = load_template(template_filename)
+
+    def build(self, conflict):
+        # Remove any residual tracks from the blank file's tracks
+        sample_root, (sample_tracks,) = copy_paths(self.template, [['LiveSet', 'Tracks']])
+        del sample_tracks[:]
+
+        # Add our branch and their branch to the sample
+        sample_tracks.append(self.build_track(conflict.ours, "10", 'Ours'))
+        sample_tracks.append(self.build_track(conflict.theirs, "20", 'Theirs'))
+        return sample_root
+
+    def build_track(self, track_elem, id_, name):
+        sample, (user_name, sends) = copy_paths(
+            track_elem, [['Name', 'UserName'], ['DeviceChain', 'Mixer', 'Sends']]
+        )
+        sample.attrib['Id'] = id_
+        user_name.attrib['Value'] = name
+
+        # Remove send values
+        del sends[:]
+        return sample
+
+    def write(self, conflict, filename):
+        sample_tree = ET.ElementTree(self.build(conflict))
+        with alsfile.open_for_writing(filename, compress=True) as f:
+            sample_tree.write(f, encoding='utf-8', xml_declaration=True)
+
+    def write_all(self, conflicts, folder, jobs=None):
+        """
+        Writes a preview .als for each conflict into folder,
+        concurrently, returning their paths in order
+        """
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        paths = [folder + '/' + 'conf_' + str(i) + '.als' for i in range(len(conflicts))]
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            # list() to raise any errors from the workers
+            list(pool.map(self.write, conflicts, paths))
+        return paths
+
+
+def load_template(filename):
+    """
+    Parses the template at filename, or returns the root parsed
+    before if the file has not changed since. The roots are shared,
+    and must not be changed
+    """
+    path = os.path.realpath(filename)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _templates.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _templates[path] = (mtime, alsfile.parse(path))
+    return cached[1]
+
+
+def copy_paths(root, paths):
+    """
+    Copies root and the elements along each path of child tags below
+    it, sharing all other elements with the original. Returns the copy
+    of root and the copy of the last element of each path
+    """
+    copied = set()
+    root_copy = shallow_copy(root)
+    copied.add(id(root_copy))
+
+    ends = []
+    for path in paths:
+        parent = root_copy
+        for tag in path:
+            for i, child in enumerate(parent):
+                if child.tag == tag:
+                    break
+            else:
+                raise ValueError('No ' + tag + ' in ' + parent.tag)
+            if id(child) not in copied:
+                child = shallow_copy(child)
+                parent[i] = child
+                copied.add(id(child))
+            parent = child
+        ends.append(parent)
+    return root_copy, ends
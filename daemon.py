@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+A long-running process that merges sets for merge.py, so that git
+does not start a new interpreter, import the driver and parse the
+conflict template for every .als file of a large rebase or merge.
+
+    python3 .merge/daemon.py &
+
+Listens on a Unix socket, .merge/daemon.sock by default, and exits
+after being idle for --idle-timeout seconds. merge.py --daemon (or
+--daemon-socket for another socket) sends it its arguments, working
+directory and the environment variables in ENVIRON, which are set for
+the merge, and merges in its own process if no daemon is listening.
+It does so too when asked for another XML backend than the daemon
+imported. The daemon keeps the summaries of the sets it has loaded
+in memory, in front of the --cache given with each merge. Only the
+summaries are kept, not the sets: a branch loaded again is then only
+decompressed, as its summary holds where its tracks are, but the base
+is parsed again for each merge, as its tree is merged into and written
+out from its own file.
+
+merge.py imports this module for request(), the server and the
+rest of the driver are in mergeserver.py, imported when serving
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+SOCKET_PATH = '.merge/daemon.sock'
+
+# Seconds without a merge before the daemon exits
+IDLE_TIMEOUT = 30 * 60
+
+# The environment variables the driver reads, sent with each merge
+ENVIRON = ('ALS_MERGE_TRACE', 'ALS_MERGE_XML', 'ALS_MERGE_SENDS', 'BROWSER')
+
+
+def request(argv, socket_path=SOCKET_PATH):
+    """
+    Has the daemon listening on socket_path run merge.run(argv) in this
+    working directory, writing out anything it reported to stderr.
+    Returns the exit status of the merge, or None if there is no daemon
+    to run it
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # Not running, or exited and left the socket behind
+        client.close()
+        return None
+
+    try:
+        with client, client.makefile('rwb') as f:
+            environ = {name: os.environ[name] for name in ENVIRON if name in os.environ}
+            f.write(json.dumps({'argv': argv, 'cwd': os.getcwd(), 'environ': environ}).encode() + b'\n')
+            f.flush()
+            line = f.readline()
+    except ConnectionError:
+        line = b''
+    if not line:
+        # The daemon stopped before answering, output is only ever
+        # replaced whole so the merge can be run again here
+        return None
+
+    response = json.loads(line.decode())
+    sys.stderr.write(response['stderr'])
+    # None if the daemon could not run it
+    return response['status']
+
+
+def serve(socket_path=SOCKET_PATH, idle_timeout=IDLE_TIMEOUT):
+    """
+    Runs the merges sent to socket_path, one at a time, until there
+    have been none for idle_timeout seconds
+    """
+    if request_is_answered(socket_path):
+        raise RuntimeError('A daemon is already listening on ' + socket_path)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    from mergeserver import MergeServer
+    server = MergeServer(socket_path, idle_timeout)
+    try:
+        server.serve_until_idle()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+def request_is_answered(socket_path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        return True
+    except (FileNotFoundError, ConnectionRefusedError):
+        return False
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge daemon for the Ableton Live set merge driver')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='by default ' + SOCKET_PATH)
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT, metavar='SECONDS',
+                        help='exit after this long without a merge')
+    args = parser.parse_args()
+    serve(args.socket, args.idle_timeout)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
-import xml.etree.ElementTree as ET
+import hashlib
+from collections import namedtuple
 
 
 IGNORE_ATTRIB_FOR = {
@@ -22,7 +23,51 @@ IGNORE_ATTRIB_FOR = {
 IGNORE_ALWAYS = {
 }
 
-def tree_equal(e1, e2, send_map):
+# IGNORE_ATTRIB_FOR as sets, looked up for every element compared
+IGNORED_ATTRIB = {tag: frozenset(keys) for tag, keys in IGNORE_ATTRIB_FOR.items()}
+NOTHING_IGNORED = frozenset()
+
+# A difference found by tree_equal between e1 and e2. path is an XPath
+# to the element in e1, starting from e1's own tag, kind is one of
+# the kinds below, and old and new are the values in e1 and e2
+Difference = namedtuple('Difference', ['path', 'kind', 'old', 'new'])
+
+TAG = 'tag'
+# old and new are the values of one attribute, None where it is missing,
+# and path ends with the attribute
+ATTRIB = 'attrib'
+# The numbers of children differ
+LEN = 'len'
+# One of the elements has children and the other has none, or is
+# missing, e.g. the send holder of a return track. old and new are
+# the numbers of children, None where it is missing
+EMPTY = 'empty'
+
+
+class DiffReport():
+    """
+    Collects the Differences found by tree_equal when passed to it,
+    in document order. Without one tree_equal stops at the first
+    difference and builds no paths
+    """
+
+    def __init__(self):
+        self.differences = []
+
+    def add(self, path, kind, old, new):
+        self.differences.append(Difference(path, kind, old, new))
+
+
+def diff(e1, e2, send_map, holders=None):
+    """
+    Returns the list of Differences between e1 and e2, as in tree_equal
+    """
+    report = DiffReport()
+    tree_equal(e1, e2, send_map, report, holders)
+    return report.differences
+
+
+def tree_equal(e1, e2, send_map, report=None, holders=None):
     """
     Calculates deep equality of two ElementTree Elements,
     leaving out unimportant circumstantial values such as
@@ -31,76 +76,220 @@ def tree_equal(e1, e2, send_map):
     Ignore:
         IsContentSelected attrib: Value
         IsArmed attrib: Value
+
+    Walks both trees together with a stack rather than recursing, so
+    deep device chains cannot reach the recursion limit, and returns
+    at the first difference. If report is a DiffReport, every
+    difference is added to it instead. holders maps Sends elements
+    whose TrackSendHolders have been indexed already, as by
+    Track.send_holders, to that index
     
     Thanks to Itamar
     https://stackoverflow.com/questions/7905380/testing-equivalence-of-xml-etree-elementtree
     """
-    if not e1:
-        if not e2:
-            return True
-        else:
+    if report is not None:
+        return _report_differences(e1, e2, send_map, report, holders)
+
+    # Pairs of elements still to compare
+    stack = [(e1, e2)]
+    pop = stack.pop
+    push = stack.append
+    extend = stack.extend
+    while stack:
+        e1, e2 = pop()
+        # Elements without children are not compared
+        if e1 is None or len(e1) == 0:
+            if e2 is not None and len(e2):
+                return False
+            continue
+        if e1.tag != e2.tag:
+            return False
+        ignored = IGNORED_ATTRIB.get(e1.tag)
+        if ignored is None:
+            if e1.attrib != e2.attrib:
+                return False
+        elif not attrib_equal(e1.attrib, e2.attrib, ignored):
+            return False
+        if len(e1) != len(e2):
             return False
-    if e1.tag != e2.tag:
-        print('tag')
-        print(e1)
-        print(e2)
-        print(str(e1.tag) + ' != ' + str(e2.tag))
-        return False
 
-    copy_e1_attrib = e1.attrib.copy()
-    copy_e2_attrib = e2.attrib.copy()
-
-    if e1.tag in IGNORE_ATTRIB_FOR:
-        remove = IGNORE_ATTRIB_FOR[e1.tag]
-        for key in remove:
-            if key in copy_e1_attrib:
-                del copy_e1_attrib[key]
-            if key in copy_e2_attrib:
-                del copy_e2_attrib[key]
-
-    if copy_e1_attrib != copy_e2_attrib:
-        print('attrib')
-        print(e1)
-        print(e2)
-        print(str(copy_e1_attrib) + ' != ' + str(copy_e2_attrib))
-        print('originally:')
-        print(str(e1.attrib) + ', ' + str(e2.attrib))
-        return False
-    if len(e1) != len(e2):
-        print('len')
-        print(e1)
-        print(e2)
-        print(str(len(e1)) + ' != ' + str(len(e2)))
-        return False
+        # For send tracks, we only care about the intersection of the two track's send tracks
+        # Ones that have been added on the track from branch will not be in base
+        # Ones that have been removed no longer matter
+        # These can be different as it is the set of return tracks that differ, when the track could
+        # actually be no different
+        # The IDs of the elements in Sends are not IDs of the tracks, they are only an ordering,
+        # therefore currently we must also pass the return tracks into this function so that we
+        # can calculate which sends actually intersect
+        if e1.tag == 'Sends':
+            extend((h1, h2) for h1, h2, _ in _send_holder_pairs(e1, e2, send_map, holders))
+            continue
+        # Most elements are leaves, which are settled here rather
+        # than pushed
+        for c1, c2 in zip(e1, e2):
+            if len(c1):
+                push((c1, c2))
+            elif len(c2):
+                return False
+    return True
+
+def _send_holder_pairs(e1, e2, send_map, holders):
+    # The pairs of send holders to compare, with the Id of the first
+    # as a third item
+    holders_1 = send_holders(e1, holders)
+    holders_2 = send_holders(e2, holders)
+    for ba_loc in send_map:
+        br_loc = send_map[ba_loc]
+        yield holders_1.get(str(br_loc)), holders_2.get(str(ba_loc)), br_loc
+
+def send_holders(sends, holders=None):
+    # The TrackSendHolders of sends by Id, from holders if indexed there
+    if holders and sends in holders:
+        return holders[sends]
+    return index_children(sends, 'TrackSendHolder', 'Id')
+
+def _report_differences(e1, e2, send_map, report, holders):
+    """
+    tree_equal adding every difference to report, with the path of
+    each element. Children are pushed in reverse so that differences
+    are reported in document order
+    """
+    equal = True
+    stack = [(e1, e2, None if e1 is None else e1.tag)]
+    while stack:
+        e1, e2, path = stack.pop()
+
+        if e1 is None or len(e1) == 0:
+            if e2 is not None and len(e2):
+                report.add(path, EMPTY, _size(e1), _size(e2))
+                equal = False
+            continue
+        if e1.tag != e2.tag:
+            report.add(path, TAG, e1.tag, e2.tag)
+            equal = False
+            continue
+
+        ignored = IGNORED_ATTRIB.get(e1.tag, NOTHING_IGNORED)
+        if not attrib_equal(e1.attrib, e2.attrib, ignored):
+            for key in sorted(set(e1.attrib.keys()) | set(e2.attrib.keys())):
+                if key not in ignored and e1.attrib.get(key) != e2.attrib.get(key):
+                    report.add(path + '/@' + key, ATTRIB, e1.attrib.get(key), e2.attrib.get(key))
+            equal = False
+        if len(e1) != len(e2):
+            report.add(path, LEN, len(e1), len(e2))
+            equal = False
+            continue
 
-    # For send tracks, we only care about the intersection of the two track's send tracks
-    # Ones that have been added on the track from branch will not be in base
-    # Ones that have been removed no longer matter
-    # These can be different as it is the set of return tracks that differ, when the track could
-    # actually be no different
-    # The IDs of the elements in Sends are not IDs of the tracks, they are only an ordering,
-    # therefore currently we must also pass the return tracks into this function so that we
-    # can calculate which sends actually intersect
-    if e1.tag == 'Sends':
-        if not e2.tag == 'Sends':
+        if e1.tag == 'Sends':
+            pairs = [
+                (h1, h2, '%s/TrackSendHolder[@Id="%s"]' % (path, id_))
+                    for h1, h2, id_ in _send_holder_pairs(e1, e2, send_map, holders)
+            ]
+        else:
+            # XPath positions count from 1 among the children with the same tag
+            pairs = []
+            positions = {}
+            for c1, c2 in zip(e1, e2):
+                position = positions[c1.tag] = positions.get(c1.tag, 0) + 1
+                pairs.append((c1, c2, '%s/%s[%d]' % (path, c1.tag, position)))
+        stack.extend(reversed(pairs))
+
+    return equal
+
+def attrib_equal(attrib_1, attrib_2, ignored):
+    """
+    Equality of two attribute dicts leaving out the keys in ignored,
+    without copying them
+    """
+    if not ignored:
+        return attrib_1 == attrib_2
+    left_out_1 = sum(1 for key in ignored if key in attrib_1)
+    left_out_2 = sum(1 for key in ignored if key in attrib_2)
+    if len(attrib_1) - left_out_1 != len(attrib_2) - left_out_2:
+        return False
+    for key, value in attrib_1.items():
+        if key not in ignored and attrib_2.get(key) != value:
             return False
-        relevant_send_results = []
-        for ba_loc in send_map:
-            br_loc = send_map[ba_loc]
-            relevant_send_results.append(
-                tree_equal(
-                    get_elem_attr_value(e1, 'TrackSendHolder', 'Id', str(br_loc)), 
-                    get_elem_attr_value(e2, 'TrackSendHolder', 'Id', str(ba_loc)),
-                    send_map
-                )
-            )
-        return all(relevant_send_results)
-
-    return all(tree_equal(c1, c2, send_map) for c1, c2 in zip(e1, e2))
+    return True
+
+def _size(elem):
+    # Number of children of elem, None if it is missing
+    return None if elem is None else len(elem)
     
 def get_elem_attr_value(elem, name, attrib, value):
-    elems = elem.findall(name)
-    for e in elems:
+    # The first child of elem called name with value for attrib, see
+    # index_children for looking up more than one
+    for e in elem.iterfind(name):
         if e.attrib[attrib] == value:
             return e
+    return None
+
+def index_children(elem, name, attrib):
+    """
+    Maps each value of attrib to the first child of elem
+    called name with that value, so that repeated lookups
+    do not scan the children again
+    """
+    index = {}
+    for e in elem.iterfind(name):
+        if e.attrib[attrib] not in index:
+            index[e.attrib[attrib]] = e
+    return index
+
+
+
 
+# digest: hash of the element with the contents of any Sends left out
+# sends: for each Sends element, in document order, the digest of each
+#   TrackSendHolder keyed by its Id
+Fingerprint = namedtuple('Fingerprint', ['digest', 'sends'])
+
+# tree_equal treats any two childless elements as equal, whatever
+# their tag or attributes, so they all share one digest
+LEAF = b'\x00'
+LEAF_DIGEST = hashlib.sha1(LEAF).digest()
+
+def fingerprint(elem, holders=None):
+    """
+    Calculates a Fingerprint of an Element in a single pass,
+    following the same rules as tree_equal, so that
+    fingerprint_equal(fingerprint(e1), fingerprint(e2), send_map)
+    gives the same answer as tree_equal(e1, e2, send_map). holders
+    is as in tree_equal
+    """
+    h = hashlib.sha1()
+    sends = []
+    _feed(h, elem, sends, holders)
+    return Fingerprint(h.digest(), sends)
+
+def _feed(h, elem, sends, holders):
+    if len(elem) == 0:
+        h.update(LEAF)
+        return
+
+    ignored = IGNORED_ATTRIB.get(elem.tag, NOTHING_IGNORED)
+    attrib = sorted(item for item in elem.attrib.items() if item[0] not in ignored)
+    h.update(('%s%r%d\x01' % (elem.tag, attrib, len(elem))).encode())
+
+    # Send holders are compared by their position in the return
+    # tracks, which is only known when comparing, so each one is
+    # hashed separately
+    if elem.tag == 'Sends':
+        sends.append({id_: fingerprint(holder).digest for id_, holder in send_holders(elem, holders).items()})
+        return
+
+    for child in elem:
+        _feed(h, child, sends, holders)
+
+def fingerprint_equal(f1, f2, send_map):
+    """
+    Equality of two Fingerprints, with send_map as in tree_equal
+    """
+    if f1.digest != f2.digest:
+        return False
+    for holders_1, holders_2 in zip(f1.sends, f2.sends):
+        for ba_loc in send_map:
+            br_loc = send_map[ba_loc]
+            if holders_1.get(str(br_loc), LEAF_DIGEST) != holders_2.get(str(ba_loc), LEAF_DIGEST):
+                return False
+    return True
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Merges where one side is unchanged, settled without parsing the sets.
+
+Most merges git hands the driver are of this kind: only one branch
+changed the set, or both made the same change. The blobs are compared
+first, then the digests of their decompressed XML, as the same set
+can be gzipped differently, e.g. with another timestamp
+"""
+import filecmp
+import os
+import shutil
+import alsfile
+
+OURS = 'ours'
+THEIRS = 'theirs'
+
+
+def unchanged_side(base_filename, ours_filename, theirs_filename):
+    """
+    Returns OURS or THEIRS if the merge of the three sets is simply
+    that side, or None if both branches changed the set differently
+    """
+    def same_blob(a, b):
+        return filecmp.cmp(a, b, shallow=False)
+
+    side = _pick(same_blob, base_filename, ours_filename, theirs_filename)
+    if side is not None:
+        return side
+
+    digests = {}
+
+    def same_content(a, b):
+        for filename in (a, b):
+            if filename not in digests:
+                digests[filename] = alsfile.content_digest(filename)
+        return digests[a] == digests[b]
+
+    return _pick(same_content, base_filename, ours_filename, theirs_filename)
+
+
+def _pick(same, base_filename, ours_filename, theirs_filename):
+    if same(ours_filename, theirs_filename) or same(base_filename, theirs_filename):
+        return OURS
+    if same(base_filename, ours_filename):
+        return THEIRS
+    return None
+
+
+def write(filename, output_filename, compress):
+    """
+    Writes the set in filename to output_filename as it is,
+    decompressing or compressing it only if needed
+    """
+    if os.path.exists(output_filename) and os.path.samefile(filename, output_filename):
+        # Ours, which git also gives as the output, is left as it is
+        return
+
+    with alsfile.replacing(output_filename) as temp_path:
+        if alsfile.is_gzipped(filename) == compress:
+            shutil.copyfile(filename, temp_path)
+        else:
+            with alsfile.open_for_reading(filename) as f_in, alsfile.open_for_writing(temp_path, compress) as f_out:
+                shutil.copyfileobj(f_in, f_out, alsfile.CHUNK_SIZE)
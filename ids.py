@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import xmlbackend
+
+
+class IdAllocator():
+    """
+    Keeps the set of ids in use and hands out fresh ones,
+    in blocks of consecutive ids above the highest id seen.
+
+    The number of elements using each id is counted, so that
+    the ids of removed elements can be released again
+    """
+
+    def __init__(self, used=()):
+        self.used = {}
+        self.next_id = 0
+        for id_ in used:
+            self.claim(id_)
+
+    @classmethod
+    def from_counts(cls, counts):
+        allocator = cls()
+        allocator.used = dict(counts)
+        if counts:
+            allocator.next_id = max(counts) + 1
+        return allocator
+
+    def claim(self, id_):
+        """
+        Records id_ as in use, returns False if it already was
+        """
+        if id_ in self.used:
+            return False
+        self.add(id_)
+        return True
+
+    def add(self, id_):
+        """
+        Records one more use of id_, even if it is already in use
+        """
+        self.used[id_] = self.used.get(id_, 0) + 1
+        if id_ >= self.next_id:
+            self.next_id = id_ + 1
+
+    def release(self, id_):
+        """
+        Records that one use of id_ has gone away
+        """
+        count = self.used.get(id_, 0)
+        if count > 1:
+            self.used[id_] = count - 1
+        elif count:
+            del self.used[id_]
+
+    def block(self, count):
+        """
+        Reserves count fresh ids, returned as a range
+        """
+        start = self.next_id
+        self.next_id += count
+        fresh = range(start, self.next_id)
+        self.used.update(dict.fromkeys(fresh, 1))
+        return fresh
+
+
+def tagged(root, tags):
+    """
+    Iterates over every element below and including root whose tag
+    is in tags, in document order, without recursing in Python
+    """
+    return xmlbackend.iter_tags(root, tags)
+
+
+def amend_collisions(nodes, allocator, attrib='Id'):
+    """
+    Claims the id of each node in turn, giving any node whose id
+    is already in use a fresh one. Returns the renumbered nodes
+    """
+    duplicate_nodes = [node for node in nodes if not allocator.claim(int(node.attrib[attrib]))]
+    for node, new_id in zip(duplicate_nodes, allocator.block(len(duplicate_nodes))):
+        node.attrib[attrib] = str(new_id)
+    return duplicate_nodes
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import alsfile
+from splice import SplicedSet
+from stream import StreamedSet
+from version import Version
+
+
+def read_through(filename, summary=None):
+    """
+    Reads through a set with StreamedSet in a worker process. The
+    copy of its XML is a named file, so that only the offsets and
+    summaries of its tracks are sent back
+    """
+    return StreamedSet(filename, summary, named_copy=True)
+
+
+def load_versions(filenames, jobs=1, cache=None, stream=False):
+    """
+    Loads a Version for each of the given files.
+
+    With stream, only the first file, which is merged into, is parsed
+    whole, by a SplicedSet so that it can be written out quickly. The
+    others are read through with StreamedSet and their tracks parsed
+    when used. All of the versions should be closed when done with.
+
+    With more than one job those files are read through in a process
+    pool while this process parses the first, so that the largest file
+    bounds the load time rather than the sum of all of them. Files
+    parsed whole are always parsed here, as an element tree is not
+    worth sending back from a worker, and cannot be with lxml.
+
+    With a SummaryCache, the tracks of files that have been loaded
+    before are not fingerprinted again, and new summaries are added
+    to the cache. Those of files read through hold where the tracks
+    are, so that such files are only decompressed when loaded again
+    """
+    keys = [cache.key(filename) if cache else None for filename in filenames]
+    summaries = [cache.get(key) if cache else None for key in keys]
+
+    # The files that are parsed whole
+    parsed = filenames[:1] if stream else filenames
+    read = list(zip(filenames, summaries))[len(parsed):]
+
+    def parse():
+        if stream:
+            spliced = SplicedSet(parsed[0])
+            return [spliced.root], [spliced]
+        return alsfile.load_roots(*parsed), [None] * len(parsed)
+
+    if jobs <= 1 or not read:
+        roots, sources = parse()
+        streamed = [StreamedSet(filename, summary) for filename, summary in read]
+    else:
+        # Starting a pool is only worth it with jobs, so neither is
+        # the import
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(jobs, len(read))) as pool:
+            futures = [pool.submit(read_through, filename, summary) for filename, summary in read]
+            try:
+                roots, sources = parse()
+            except BaseException:
+                # Removes their copies
+                for future in futures:
+                    if not future.exception():
+                        future.result().close()
+                raise
+            streamed = [future.result() for future in futures]
+
+    versions = []
+    for root, source, key, summary in zip(roots, sources, keys, summaries):
+        version = Version(root, summary, source=source)
+        if cache and not cache.contains(key):
+            cache.put(key, summary or version.summary())
+        versions.append(version)
+
+    for streamed_set, key, summary in zip(streamed, keys[len(parsed):], summaries[len(parsed):]):
+        # Including those cached from being parsed whole, without a layout
+        if cache and (summary is None or summary.layout is None):
+            cache.put(key, streamed_set.summary._replace(layout=streamed_set.layout()))
+        versions.append(streamed_set.version())
+    return versions
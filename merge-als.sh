@@ -1,10 +1,4 @@
 #!/bin/bash
-mkdir .merge/mergetemp
-gzip -cd $1 > .merge/mergetemp/base.xml
-gzip -cd $2 > .merge/mergetemp/ours.xml
-gzip -cd $3 > .merge/mergetemp/theirs.xml
-
-/usr/local/bin/python3 .merge/merge.py .merge/mergetemp/base.xml .merge/mergetemp/ours.xml .merge/mergetemp/theirs.xml .merge/mergetemp/merged.xml
-gzip -c .merge/mergetemp/merged.xml > $2
-
-rm -r .merge/mergetemp
+# merge.py reads the gzipped sets directly and writes the result over %A,
+# through daemon.py if it is running
+/usr/local/bin/python3 .merge/merge.py --daemon --cache .merge/cache "$1" "$2" "$3" "$2"
@@ -62,8 +62,15 @@
 '''
 
 import sys
-import xml.etree.ElementTree as ET
-from version import Version, Track
+import argparse
+import alsfile
+import daemon
+import fastpath
+import loader
+import splice
+import tracing
+from cache import SummaryCache
+from wait import ResolutionTimeout
 
 COLLIDABLE_TAG = [
         "AutomationTarget",
@@ -75,38 +82,104 @@ COLLIDABLE_TAG = [
         "SampleOffsetModulationTarget"
 ]
 
-def run(argv=None):
+def run(argv=None, memory_cache=None):
+    """
+    memory_cache is the cache.MemoryCache of daemon.py, which
+    runs the merges sent to it through here
+    """
     if not argv:
         # Ignore program name
         argv = sys.argv[1:]
 
-    if len(argv) < 4:
+    parser = argparse.ArgumentParser(description='Merge driver for Ableton Live sets')
+    parser.add_argument('files', nargs='*', help='base, ours, theirs and output locations')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of processes used to load the sets concurrently')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='folder to cache the track fingerprints of the sets in between merges')
+    parser.add_argument('--resolve-timeout', type=float, metavar='SECONDS',
+                        help='give up if conflicts are not resolved in time, leaving the merge conflicted')
+    parser.add_argument('--trace', action='store_true',
+                        help='append the time, memory and size of each phase of the merge to '
+                             + tracing.TRACE_FILE + ' (or set ' + tracing.TRACE_ENV + ')')
+    parser.add_argument('--trace-file', metavar='FILE',
+                        help='trace to FILE instead, implies --trace')
+    parser.add_argument('--daemon', action='store_true',
+                        help='have the daemon listening on ' + daemon.SOCKET_PATH + ' merge, '
+                             'if there is one (see daemon.py)')
+    parser.add_argument('--daemon-socket', metavar='SOCKET',
+                        help='the socket of the daemon instead, implies --daemon')
+    args = parser.parse_args(argv)
+
+    if (args.daemon or args.daemon_socket) and memory_cache is None:
+        status = daemon.request(argv, args.daemon_socket or daemon.SOCKET_PATH)
+        if status is not None:
+            if status:
+                exit(status)
+            return
+
+    if len(args.files) < 4:
         sys.stderr.write("Please input three files and specify an output location")
         exit(-1)
 
-    output_filename = argv[3]
-
-    base_filename = argv[0]
-    ours_filename = argv[1]
-    theirs_filename = argv[2] 
-
-    tree_base = ET.parse(argv[0])
-    tree_out = ET.parse(argv[0])
-    tree_ours = ET.parse(argv[1])
-    tree_theirs = ET.parse(argv[2])
-    
-    root_base = tree_base.getroot()
-    root_out = tree_out.getroot()
-    root_ours = tree_ours.getroot()
-    root_theirs = tree_theirs.getroot()
-
-    base_version = Version(root_base)
-    our_version = Version(root_ours)
-    their_version = Version(root_theirs)
-
-    base_version.merge_with(our_version, their_version)
-
-    base_version.write(output_filename)
+    output_filename = args.files[3]
+
+    base_filename = args.files[0]
+    ours_filename = args.files[1]
+    theirs_filename = args.files[2] 
+
+    # git hands us the gzipped .als blobs directly, the merged
+    # set is written back in the same format as ours (%A)
+    compress = alsfile.is_gzipped(ours_filename)
+
+    cache = SummaryCache(args.cache) if args.cache else None
+    if memory_cache is not None:
+        memory_cache.backing = cache
+        cache = memory_cache
+
+    tracing.start(args.trace_file or (tracing.TRACE_FILE if args.trace else None))
+    try:
+        # Only when both branches changed the set is it parsed
+        with tracing.phase('fast_path'):
+            side = fastpath.unchanged_side(base_filename, ours_filename, theirs_filename)
+        if side is not None:
+            with tracing.phase('write'):
+                fastpath.write(ours_filename if side == fastpath.OURS else theirs_filename, output_filename, compress)
+            return
+        merge(base_filename, ours_filename, theirs_filename, output_filename, compress, cache, args)
+    finally:
+        # argv rather than sys.argv, which is the daemon's when it merges
+        tracing.stop(argv=argv, files=args.files, jobs=args.jobs)
+
+
+def merge(base_filename, ours_filename, theirs_filename, output_filename, compress, cache, args):
+    # Only the base is parsed whole, the tracks of the branches
+    # are read from their files as the merge needs them, and the
+    # tracks of the base that are not changed are copied as they are
+    with tracing.phase('load'):
+        base_version, our_version, their_version = loader.load_versions(
+            [base_filename, ours_filename, theirs_filename], jobs=args.jobs, cache=cache, stream=True
+        )
+
+    # The base is closed however the merge ends, as the daemon
+    # would otherwise keep its files open
+    try:
+        try:
+            with tracing.phase('merge', base_version.tree):
+                base_version.merge_with(our_version, their_version, resolve_timeout=args.resolve_timeout)
+        except ResolutionTimeout as e:
+            # %A is left as it is, which git reports as a conflict
+            sys.stderr.write(str(e) + "\n")
+            exit(1)
+        finally:
+            # Before the output, which is usually ours, is written over
+            our_version.close()
+            their_version.close()
+
+        with tracing.phase('write'):
+            splice.write(base_version, output_filename, compress=compress)
+    finally:
+        base_version.close()
 
 
 if __name__ == '__main__':
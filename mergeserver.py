@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+The server half of daemon.py
+"""
+import contextlib
+import io
+import json
+import os
+import socketserver
+import sys
+import traceback
+import daemon
+import merge
+import xmlbackend
+from cache import MemoryCache
+
+
+class MergeHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # A connection only checking that the daemon is up
+            return
+        message = json.loads(line.decode())
+        status, stderr = self.server.merge(message['argv'], message['cwd'], message.get('environ', {}))
+        self.wfile.write(json.dumps({'status': status, 'stderr': stderr}).encode() + b'\n')
+
+
+class MergeServer(socketserver.UnixStreamServer):
+    """
+    Runs the merges sent to it by daemon.request(), with the
+    driver imported once
+    """
+
+    def __init__(self, socket_path, idle_timeout=None):
+        super().__init__(socket_path, MergeHandler)
+        self.timeout = idle_timeout
+        self.idle = False
+        self.memory_cache = MemoryCache()
+
+    def handle_timeout(self):
+        self.idle = True
+
+    def serve_until_idle(self):
+        while not self.idle:
+            self.handle_request()
+
+    def merge(self, argv, cwd, environ=None):
+        """
+        Runs merge.run(argv) in cwd with the variables of daemon.ENVIRON
+        as in environ, returning its exit status and what it wrote to
+        stderr. The status is None if it needs another XML backend
+        """
+        environ = environ or {}
+        if environ.get(xmlbackend.BACKEND_ENV, xmlbackend.NAME) != xmlbackend.NAME:
+            return None, ''
+
+        stderr = io.StringIO()
+        previous_cwd = os.getcwd()
+        try:
+            os.chdir(cwd)
+            with contextlib.redirect_stderr(stderr), environment(environ):
+                merge.run(argv, memory_cache=self.memory_cache)
+            status = 0
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception:
+            traceback.print_exc(file=stderr)
+            status = 1
+        finally:
+            os.chdir(previous_cwd)
+        return status, stderr.getvalue()
+
+
+@contextlib.contextmanager
+def environment(environ):
+    """
+    Sets the variables of daemon.ENVIRON to those in environ, and
+    unsets the others, until the block exits
+    """
+    previous = {name: os.environ.get(name) for name in daemon.ENVIRON}
+    browser_changed = environ.get('BROWSER') != previous['BROWSER']
+    for name in daemon.ENVIRON:
+        set_variable(name, environ.get(name))
+    if browser_changed:
+        reset_browsers()
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            set_variable(name, value)
+        if browser_changed:
+            reset_browsers()
+
+
+def set_variable(name, value):
+    if value is None:
+        os.environ.pop(name, None)
+    else:
+        os.environ[name] = value
+
+
+def reset_browsers():
+    # webbrowser only reads BROWSER when it is first used
+    if 'webbrowser' in sys.modules:
+        sys.modules['webbrowser']._tryorder = None
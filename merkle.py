@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import xmlbackend
+from equal import IGNORE_ATTRIB_FOR
+
+# Send holders are left out of the index. Changes to them are
+# detected by the track fingerprint and merged through the tracks'
+# return maps, as generate_sends rebuilds them from those anyway
+SENDS_DIGEST = hashlib.sha1(b'Sends').digest()
+
+
+class MerkleNode():
+    """
+    Digest of an Element and of each of its children, so that the
+    subtrees that differ between two versions of a track can be found
+    without walking the parts that are the same.
+
+    Attributes are compared as in tree_equal, but unlike tree_equal
+    childless elements are compared too, so that a change to one in
+    either branch, such as a new name or volume, is merged or conflicts
+    rather than being dropped
+    """
+
+    __slots__ = ('elem', 'header', 'digest', 'children')
+
+    def __init__(self, elem):
+        self.elem = elem
+        self.children = []
+
+        if elem.tag == 'Sends':
+            self.header = SENDS_DIGEST
+            self.digest = SENDS_DIGEST
+            return
+
+        ignored = IGNORE_ATTRIB_FOR.get(elem.tag, ())
+        attrib = sorted(item for item in elem.attrib.items() if item[0] not in ignored)
+        self.header = hashlib.sha1(('%s%r%d' % (elem.tag, attrib, len(elem))).encode()).digest()
+        if len(elem) == 0:
+            self.digest = self.header
+            return
+
+        h = hashlib.sha1(self.header)
+        for child in elem:
+            node = MerkleNode(child)
+            self.children.append(node)
+            h.update(node.digest)
+        self.digest = h.digest()
+
+
+def changed_subtrees(base, branch):
+    """
+    Returns a dict of path: MerkleNode for the smallest subtrees of
+    branch that differ from base. A path is the tuple of child indices
+    leading to the subtree from the root, and only descends into
+    subtrees whose digests differ
+    """
+    changed = {}
+    stack = [((), base, branch)]
+    while stack:
+        path, base_node, branch_node = stack.pop()
+        if base_node.digest == branch_node.digest:
+            continue
+        if base_node.header != branch_node.header:
+            changed[path] = branch_node
+            continue
+        for i, (base_child, branch_child) in enumerate(zip(base_node.children, branch_node.children)):
+            if base_child.digest != branch_child.digest:
+                stack.append((path + (i,), base_child, branch_child))
+    return changed
+
+
+def merge3(base, ours, theirs):
+    """
+    Three-way merge of two branches of a track at the subtree level.
+
+    Returns the list of (path, MerkleNode) replacements to apply to base
+    that carry both sets of changes, or None if the branches changed the
+    same subtree differently, or one changed a subtree containing the other
+    """
+    our_changes = changed_subtrees(base, ours)
+    their_changes = changed_subtrees(base, theirs)
+
+    if () in our_changes or () in their_changes:
+        # The track itself differs (e.g. number of children)
+        return None
+
+    def overlaps(path, other_changes):
+        return any(path[:i] in other_changes for i in range(1, len(path)))
+
+    replacements = list(our_changes.items())
+    for path, node in their_changes.items():
+        if path in our_changes:
+            # Fine if both made the same change
+            if our_changes[path].digest != node.digest:
+                return None
+            continue
+        if overlaps(path, our_changes):
+            return None
+        replacements.append((path, node))
+
+    for path in our_changes:
+        if overlaps(path, their_changes):
+            return None
+
+    return replacements
+
+
+def apply(elem, replacements):
+    """
+    Splices the subtrees returned by merge3 into elem,
+    returning the (old, new) pairs of elements swapped
+    """
+    replaced = []
+    for path, node in replacements:
+        parent = elem
+        for i in path[:-1]:
+            parent = parent[i]
+        new = xmlbackend.attachable(node.elem)
+        replaced.append((parent[path[-1]], new))
+        parent[path[-1]] = new
+    return replaced
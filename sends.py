@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+The send levels of the tracks of a Version, held as a matrix with a
+row for each track and a column for each return track.
+
+Each track's return_map is a SendRow, a dict-like view of its row
+keyed by return track id. The send levels in the order of the return
+tracks, reordered, with new return tracks added and removed ones left
+out, are gathered column-wise for all rows sharing the same columns,
+and rows are merged three ways element by element.
+
+A matrix of at least NUMPY_MIN_SENDS sends uses NumPy when it is
+installed, smaller ones array('d'), as importing NumPy takes longer
+than it saves on them. Set ALS_MERGE_SENDS to 'numpy' or 'array' to
+use one for every matrix, which is read again for each matrix as the
+daemon changes it between merges. NumPy is only imported once a
+matrix uses it. A send that a track does not have is NaN
+"""
+import os
+from array import array
+from collections.abc import MutableMapping
+
+BACKEND_ENV = 'ALS_MERGE_SENDS'
+
+NUMPY = 'numpy'
+ARRAY = 'array'
+
+MISSING = float('nan')
+
+# Tracks times return tracks from which NumPy is faster, measured
+# with the import included
+NUMPY_MIN_SENDS = 1024 * 1024
+
+# The numpy module, or False if it is not installed, once imported
+_numpy = None
+
+
+def _import_numpy(required=False):
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    if required and not _numpy:
+        raise ImportError('ALS_MERGE_SENDS is ' + NUMPY + ' but NumPy is not installed')
+    return _numpy
+
+
+def _backend(size):
+    # The numpy module for a matrix of size sends, or False for array
+    name = os.environ.get(BACKEND_ENV) or None
+    if name not in (None, NUMPY, ARRAY):
+        raise ValueError('Unknown send backend ' + repr(name) + ', use ' + NUMPY + ' or ' + ARRAY)
+    if name == ARRAY or name is None and size < NUMPY_MIN_SENDS:
+        return False
+    return _import_numpy(required=name == NUMPY)
+
+
+def _backend_of(*values):
+    # The numpy module if any of values, those of SendRows, is a
+    # NumPy array, otherwise False
+    if all(isinstance(row_values, (array, memoryview)) for row_values in values):
+        return False
+    return _import_numpy()
+
+
+def backend_name(size):
+    """
+    The backend used for a matrix of size sends
+    """
+    return NUMPY if _backend(size) else ARRAY
+
+
+class Columns():
+    """
+    The return track ids of the columns of a matrix, in order, each once
+    """
+
+    __slots__ = ('ids', 'index')
+
+    def __init__(self, ids):
+        self.ids = []
+        # Return track id to column
+        self.index = {}
+        for id_ in ids:
+            if id_ not in self.index:
+                self.index[id_] = len(self.ids)
+                self.ids.append(id_)
+
+    def same_as(self, other):
+        return self is other or self.ids == other.ids
+
+
+class SendMatrix():
+    """
+    Send levels with a row for each track, built from the TrackSendHolders
+    of the tracks as read, see Version
+    """
+
+    def __init__(self, columns, rows):
+        self.columns = columns
+        numpy = _backend(rows * len(columns.ids))
+        if numpy:
+            self.values = numpy.full((rows, len(columns.ids)), MISSING)
+            # Views of values
+            self._rows = list(self.values)
+        else:
+            width = len(columns.ids)
+            self.values = array('d', [MISSING]) * (rows * width)
+            view = memoryview(self.values)
+            self._rows = [view[i * width:(i + 1) * width] for i in range(rows)]
+
+    @classmethod
+    def from_positions(cls, return_ids, position_maps):
+        """
+        A matrix with a row for each of position_maps, which map the
+        position of a return track in return_ids to the send level,
+        as the TrackSendHolders are numbered. Where a return track id
+        is repeated the last of its levels is kept
+        """
+        columns = Columns(return_ids)
+        column_of = [columns.index[id_] for id_ in return_ids]
+        matrix = cls(columns, len(position_maps))
+        for row, positions in zip(matrix._rows, position_maps):
+            for position, value in positions.items():
+                row[column_of[position]] = value
+        return matrix
+
+    def rows(self):
+        """
+        A SendRow for each row, changing the matrix when set
+        """
+        return [SendRow(self.columns, values) for values in self._rows]
+
+
+class SendRow(MutableMapping):
+    """
+    The send levels of one track keyed by return track id, a row of a
+    SendMatrix until a send to a return track outside its columns is set
+    """
+
+    __slots__ = ('columns', 'values')
+
+    def __init__(self, columns, values):
+        self.columns = columns
+        self.values = values
+
+    def __getitem__(self, id_):
+        value = self.values[self.columns.index[id_]]
+        if value != value:
+            raise KeyError(id_)
+        return float(value)
+
+    def __setitem__(self, id_, value):
+        column = self.columns.index.get(id_)
+        if column is not None:
+            self.values[column] = value
+            return
+        # Taken out of the matrix, which keeps its columns
+        self.columns = Columns(self.columns.ids + [id_])
+        values = array('d', self.values)
+        values.append(value)
+        numpy = _backend_of(self.values)
+        self.values = numpy.array(values) if numpy else values
+
+    def __delitem__(self, id_):
+        # Raises KeyError if there is no send
+        self[id_]
+        self.values[self.columns.index[id_]] = MISSING
+
+    def __iter__(self):
+        return (id_ for id_, value in zip(self.columns.ids, self.values) if value == value)
+
+    def __len__(self):
+        return sum(1 for value in self.values if value == value)
+
+    def __repr__(self):
+        return 'SendRow(' + repr(dict(self)) + ')'
+
+
+def gather(return_maps, return_ids, default=0.0):
+    """
+    The send levels of each of return_maps to the return tracks with
+    return_ids, in order, as lists. A return id can be repeated, and
+    default is used where a map has no send to it. Every SendRow with
+    the same columns is gathered in one operation
+    """
+    gathered = [None] * len(return_maps)
+
+    groups = []
+    for i, return_map in enumerate(return_maps):
+        if not isinstance(return_map, SendRow):
+            gathered[i] = [return_map.get(id_, default) for id_ in return_ids]
+            continue
+        for columns, indices in groups:
+            if columns.same_as(return_map.columns):
+                indices.append(i)
+                break
+        else:
+            groups.append((return_map.columns, [i]))
+
+    for columns, indices in groups:
+        # Column to take for each return id, the one past the
+        # last for those without one, which is missing
+        width = len(columns.ids)
+        take = [columns.index.get(id_, width) for id_ in return_ids]
+        numpy = _backend_of(*(return_maps[i].values for i in indices))
+        if numpy:
+            block = numpy.full((len(indices), width + 1), MISSING)
+            block[:, :width] = [return_maps[i].values for i in indices]
+            # default is filled in as given, so that an int 0 is still
+            # written as one
+            for i, row in zip(indices, block[:, take].tolist()):
+                gathered[i] = [value if value == value else default for value in row]
+        else:
+            for i in indices:
+                values = list(return_maps[i].values)
+                values.append(MISSING)
+                gathered[i] = [values[j] if values[j] == values[j] else default for j in take]
+    return gathered
+
+
+def merge(base, ours, theirs):
+    """
+    Three-way merge of the send levels of a track, None if a send
+    was set to different levels in ours and theirs. A send missing
+    from one branch takes the level from the other. SendRows with the
+    same columns are merged element-wise, giving a SendRow
+    """
+    rows = (base, ours, theirs)
+    if all(isinstance(r, SendRow) for r in rows) and all(r.columns.same_as(base.columns) for r in rows):
+        return _merge_rows(base, ours, theirs)
+
+    merged = {}
+    for key in set(ours) | set(theirs):
+        value = _merge_value(base.get(key), ours.get(key), theirs.get(key))
+        if value is _CONFLICT:
+            return None
+        merged[key] = value
+    return merged
+
+
+_CONFLICT = object()
+
+
+def _merge_value(b, o, t):
+    # The merged value of one send, None when missing
+    if t is None or t == b or t == o:
+        return o if o is not None else t
+    if o is None or o == b:
+        return t
+    return _CONFLICT
+
+
+def _merge_rows(base, ours, theirs):
+    numpy = _backend_of(base.values, ours.values, theirs.values)
+    if numpy:
+        b, o, t = (numpy.asarray(r.values) for r in (base, ours, theirs))
+        o_missing = numpy.isnan(o)
+        take_ours = numpy.isnan(t) | (t == b) | (t == o)
+        take_theirs = o_missing | (o == b)
+        if not (take_ours | take_theirs).all():
+            return None
+        return SendRow(base.columns, numpy.where(take_ours & ~o_missing, o, t))
+
+    values = array('d')
+    for b, o, t in zip(base.values, ours.values, theirs.values):
+        # NaN to None, as in a dict
+        value = _merge_value(b if b == b else None, o if o == o else None, t if t == t else None)
+        if value is _CONFLICT:
+            return None
+        values.append(MISSING if value is None else value)
+    return SendRow(base.columns, values)
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+import mmap
+import shutil
+import tempfile
+import xmlbackend
+from xmlbackend import ET
+from xml.parsers import expat
+import alsfile
+from version import Version
+
+# The elements of LiveSet that are written out again, the
+# tracks themselves being the children of Tracks
+LIVESET_PATH = ['Ableton', 'LiveSet']
+TRACKS_PATH = LIVESET_PATH + ['Tracks']
+SPLICED_TAGS = ('Tracks', 'SendsPre')
+
+CHUNK_SIZE = 1024 * 1024
+
+# How far back from a start tag the end tag before it is looked for
+WHITESPACE_WINDOW = 256
+
+
+class SplicedSet():
+    """
+    A set parsed whole to be merged into, remembering where each of
+    its tracks and its SendsPre element are in its XML.
+
+    write() copies the XML of every track that has not changed straight
+    from the original, so only the changed and added tracks and SendsPre
+    are serialized again. Anything else changed in the tree is not
+    written, which holds for Version.merge_with. Call close() once done.
+
+    With lxml the set is parsed by lxml itself, which is several times
+    faster than building the tree from expat's callbacks, and the tracks
+    are then found in the XML by their start tags. The standard library
+    builds its tree faster from expat, which gives where each element is
+    """
+
+    def __init__(self, filename):
+        # Element to the offset of its start tag and just past its end
+        self.ranges = {}
+        native = xmlbackend.NAME == xmlbackend.LXML
+        self.root = None
+        with alsfile.open_for_reading(filename) as f:
+            if alsfile.is_gzipped(filename):
+                # Decompressed once, to copy from when writing
+                self.file = tempfile.TemporaryFile()
+                if native:
+                    shutil.copyfileobj(f, self.file, CHUNK_SIZE)
+                else:
+                    self.root = self.parse(f, copy_to=self.file)
+                self.file.flush()
+            else:
+                self.file = open(filename, 'rb')
+                if not native:
+                    self.root = self.parse(f)
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.root is None:
+            self.root = self.parse_natively()
+        else:
+            self.end_ranges()
+
+        live_set = self.root.find('LiveSet')
+        self.tracks = live_set.find('Tracks')
+        self.sends_pre = live_set.find('SendsPre')
+        # SendsPre is only ever added to
+        self.sends_pre_count = len(self.sends_pre) if self.sends_pre is not None else 0
+        # Tracks are written from where the first track was to
+        # the end tag of Tracks
+        self.tracks_region = None
+        if len(self.tracks) and self.tracks in self.ranges:
+            self.tracks_region = (
+                self.ranges[self.tracks[0]][0],
+                self.data.rfind(b'</', 0, self.ranges[self.tracks][1]),
+            )
+
+    def parse_natively(self):
+        """
+        Parses the set with the XML backend's own parser and locates its
+        tracks and SendsPre, falling back to parse() if they cannot be
+        """
+        self.file.seek(0)
+        root = xmlbackend.parse(self.file)
+        live_set = root.find('LiveSet')
+        tracks = live_set.find('Tracks')
+        sends_pre = live_set.find('SendsPre')
+
+        located = locate_tracks(self.data, [(t.tag, t.attrib['Id']) for t in tracks])
+        sends_pre_range = None
+        if located is not None and sends_pre is not None:
+            sends_pre_range = locate_element(self.data, 'SendsPre', located[1][1])
+        if sends_pre_range is None:
+            self.file.seek(0)
+            root = self.parse(self.file)
+            self.end_ranges()
+            return root
+
+        track_ranges, self.ranges[tracks] = located
+        self.ranges.update(zip(tracks, track_ranges))
+        self.ranges[sends_pre] = sends_pre_range
+        return root
+
+    def parse(self, f, copy_to=None):
+        """
+        Builds the tree from expat, recording where the tracks, Tracks
+        and SendsPre are
+        """
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        builder = ET.TreeBuilder()
+        path = []
+        # Depth to the element being recorded at it, and its start
+        opened = {}
+
+        def start_element(tag, attrib):
+            elem = builder.start(tag, attrib)
+            depth = len(path)
+            if (depth == 3 and path == TRACKS_PATH or
+                    depth == 2 and tag in SPLICED_TAGS and path == LIVESET_PATH):
+                opened[depth] = (elem, parser.CurrentByteIndex)
+            path.append(tag)
+
+        def end_element(tag):
+            elem = builder.end(tag)
+            path.pop()
+            if len(path) in opened and opened[len(path)][0] is elem:
+                _, start = opened.pop(len(path))
+                self.ranges[elem] = (start, parser.CurrentByteIndex)
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = builder.data
+
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            if copy_to is not None:
+                copy_to.write(chunk)
+            parser.Parse(chunk, False)
+        parser.Parse(b'', True)
+        return builder.close()
+
+    def end_ranges(self):
+        # expat gives where end tags start, rather than where elements end
+        self.ranges = {
+            elem: (start, element_end(self.data, start, end))
+                for elem, (start, end) in self.ranges.items()
+        }
+
+    def version(self, summary=None):
+        return Version(self.root, summary, source=self)
+
+    def can_splice(self, version):
+        declaration = b''
+        if self.data[:5] == b'<?xml':
+            declaration = self.data[:self.data.find(b'?>')]
+        return (
+            version.tree is self.root and
+            self.tracks_region is not None and
+            self.sends_pre in self.ranges and
+            # Serialized elements are UTF-8
+            (not declaration or b'utf-8' in declaration.lower())
+        )
+
+    def write(self, version, filename, compress=False):
+        """
+        Writes version, which must have been read by this set, to filename
+        """
+        if not self.can_splice(version):
+            version.write(filename, compress)
+            return
+
+        changed = {id(t.elem) for t in version.tracks if t.changed}
+
+        track_parts = []
+        for elem in self.tracks:
+            if elem in self.ranges and id(elem) not in changed:
+                start, end = self.ranges[elem]
+                # With the whitespace after it, as its tail
+                tail_end = self.data.find(b'<', end)
+                track_parts.append(memoryview(self.data)[start:tail_end])
+            else:
+                track_parts.append(serialize(elem))
+
+        regions = [(*self.tracks_region, track_parts)]
+        if len(self.sends_pre) != self.sends_pre_count:
+            regions.append((*self.ranges[self.sends_pre], [serialize(self.sends_pre, tail=False)]))
+        regions.sort(key=lambda region: region[0])
+
+        # filename may be the file being copied from
+        with alsfile.replacing(filename) as temp_path:
+            with alsfile.open_for_writing(temp_path, compress) as f:
+                position = 0
+                for start, end, parts in regions:
+                    f.write(memoryview(self.data)[position:start])
+                    for part in parts:
+                        f.write(part)
+                    position = end
+                f.write(memoryview(self.data)[position:])
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def element_end(data, start, end):
+    """
+    The offset just past the element starting at start, given where
+    expat reported its end, which is just past the tag for an empty
+    element and the start of the end tag for any other
+    """
+    if data.find(b'>', start) == end - 1 and data[end - 2:end] == b'/>':
+        return end
+    return data.find(b'>', end) + 1
+
+
+def locate_tracks(data, tracks):
+    """
+    Finds the tracks, given as the tag and Id of each in order, in the
+    XML of a set in data by their start tags. Returns the offset of the
+    start tag of each and just past its end tag, and the same for the
+    Tracks element, or None if the XML is not laid out as expected,
+    each track following the end tag of the one before
+    """
+    tracks_tag = data.find(b'<Tracks>', max(data.find(b'<LiveSet'), 0))
+    if not tracks or tracks_tag == -1:
+        return None
+    first = tracks_tag + len(b'<Tracks>')
+
+    starts = []
+    position = first
+    for tag, id_ in tracks:
+        start_tag = ('<%s Id="%s"' % (tag, id_)).encode()
+        start = data.find(start_tag, position)
+        if start == -1:
+            return None
+        starts.append(start)
+        position = start + len(start_tag)
+    tracks_end = data.find(b'</Tracks>', position)
+    if tracks_end == -1 or before_whitespace(data, starts[0]) != first:
+        return None
+
+    ranges = []
+    for (tag, _), start, following in zip(tracks, starts, starts[1:] + [tracks_end]):
+        end = before_whitespace(data, following)
+        end_tag = ('</%s>' % tag).encode()
+        if data[end - len(end_tag):end] != end_tag:
+            return None
+        ranges.append((start, end))
+    return ranges, (tracks_tag, tracks_end + len(b'</Tracks>'))
+
+
+def locate_element(data, tag, position):
+    """
+    The offset of the start tag of the first tag element from position
+    in data and just past its end, which it must not contain another
+    of, or None if there is none
+    """
+    start_tag = ('<%s' % tag).encode()
+    start = data.find(start_tag, position)
+    if start == -1 or data[start + len(start_tag):start + len(start_tag) + 1] not in (b'>', b' ', b'/'):
+        return None
+    close = data.find(b'>', start)
+    if data[close - 1:close] == b'/':
+        return start, close + 1
+    end = data.find(('</%s>' % tag).encode(), close)
+    if end == -1:
+        return None
+    return start, end + len(tag) + 3
+
+
+def before_whitespace(data, offset):
+    # offset less the whitespace just before it, looking back
+    # no further than WHITESPACE_WINDOW
+    window = data[max(offset - WHITESPACE_WINDOW, 0):offset]
+    return offset - (len(window) - len(window.rstrip()))
+
+
+def serialize(elem, tail=True):
+    xml = ET.tostring(elem, encoding='unicode')
+    if not tail and elem.tail:
+        xml = xml[:-len(elem.tail)]
+    return xml.encode('utf-8')
+
+
+def write(version, filename, compress=False):
+    """
+    Writes version with its SplicedSet if it was read by one,
+    otherwise serializing the whole tree
+    """
+    if isinstance(version.source, SplicedSet):
+        version.source.write(version, filename, compress)
+    else:
+        version.write(filename, compress)
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+import mmap
+import os
+import shutil
+import tempfile
+import xmlbackend
+from xmlbackend import ET
+from collections import namedtuple
+from xml.parsers import expat
+import alsfile
+from splice import locate_tracks
+from version import Version, VersionSummary, Track, COLLIDABLE_TAGS
+
+# Where the tracks are in the document
+TRACKS_PATH = ['Ableton', 'LiveSet', 'Tracks']
+
+# The tags of tracks, for lxml to hand over only those
+TRACK_TAGS = ('MidiTrack', 'AudioTrack', 'ReturnTrack', 'GroupTrack')
+
+CHUNK_SIZE = 1024 * 1024
+
+# How much more is read at a time to find the end of a track's end tag
+READ_AHEAD = 256
+
+# A track's tag, the offset of its start tag in the decompressed
+# XML and an offset within or just before its end tag
+TrackEntry = namedtuple('TrackEntry', ['tag', 'start', 'end'])
+
+
+class StreamedSet():
+    """
+    A set that has been read through once, keeping only where each
+    track is in its XML and the summary of each track, so that memory
+    does not grow with the size of the set.
+
+    Tracks are parsed again, one at a time, from a seekable copy of
+    the decompressed XML when they are used. Call close() once no
+    more tracks will be used.
+
+    With lxml the set is read through by lxml's parser, handing over
+    only the tracks, which are then found in the XML by their start
+    tags as in SplicedSet. The standard library reads through it faster
+    with expat, which gives where each track is.
+
+    With named_copy, the copy of a gzipped set is a named file rather
+    than an anonymous one, so that the StreamedSet can be pickled, as
+    it is to be sent back from a worker process, and opened again.
+
+    A summary with a layout, cached from an earlier StreamedSet of the
+    same file, is all that reading it through gives, so the set is then
+    only decompressed
+    """
+
+    def __init__(self, filename, summary=None, named_copy=False):
+        self.filename = filename
+        self.source = None
+        # The named copy of the XML, removed on close
+        self.copy_path = None
+        self.entries = []
+        self.root = None
+        native = xmlbackend.NAME == xmlbackend.LXML
+        compressed = alsfile.is_gzipped(filename)
+        scanned = summary is None or summary.layout is None
+        if not scanned:
+            self.summary = summary
+            entries, root = summary.layout
+            self.entries = [TrackEntry(*entry) for entry in entries]
+            self.root = xmlbackend.fromstring(root)
+        with alsfile.open_for_reading(filename) as f:
+            if compressed:
+                # gzip can only seek by decompressing from the start
+                if named_copy:
+                    fd, self.copy_path = tempfile.mkstemp(suffix='.xml')
+                    self.source = os.fdopen(fd, 'w+b')
+                else:
+                    self.source = tempfile.TemporaryFile()
+                if native or not scanned:
+                    shutil.copyfileobj(f, self.source, CHUNK_SIZE)
+                    self.source.flush()
+                else:
+                    self.summary = self.scan(f, summary, copy_to=self.source)
+            elif scanned and not native:
+                self.summary = self.scan(f, summary)
+        if self.source is None:
+            self.source = open(filename, 'rb')
+        if scanned and native:
+            self.summary = self.scan_natively(summary)
+
+    def __getstate__(self):
+        if alsfile.is_gzipped(self.filename) and self.copy_path is None:
+            raise TypeError('Only a StreamedSet with a named copy can be pickled')
+        self.source.flush()
+        state = dict(self.__dict__)
+        # Opened again by name, and the root is not picklable with lxml
+        state['source'] = None
+        state['root'] = ET.tostring(self.root)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.root = xmlbackend.fromstring(self.root)
+        self.source = open(self.copy_path or self.filename, 'rb')
+
+    def scan(self, f, summary=None, copy_to=None):
+        """
+        Reads the XML from f, recording the offsets of the tracks. Each
+        track is built while it is read, to be summarised, unless the
+        summary of the set is known already. Returns the summary
+        """
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        path = []
+        builder = None
+        start = None
+        id_counts = {}
+        track_summaries = []
+
+        def start_element(tag, attrib):
+            nonlocal builder, start
+            if tag in COLLIDABLE_TAGS:
+                id_ = int(attrib['Id'])
+                id_counts[id_] = id_counts.get(id_, 0) + 1
+
+            if builder is not None:
+                builder.start(tag, attrib)
+            elif path == TRACKS_PATH:
+                start = parser.CurrentByteIndex
+                if summary is None:
+                    builder = ET.TreeBuilder()
+                    builder.start(tag, attrib)
+            elif path == TRACKS_PATH[:len(path)] and tag == TRACKS_PATH[len(path)]:
+                # Keep the elements on the way to the tracks,
+                # without their other children
+                if self.root is None:
+                    self.root = ET.Element(tag, attrib)
+                else:
+                    ET.SubElement(self.root.find('/'.join(path[1:]) or '.'), tag, attrib)
+            path.append(tag)
+
+        def end_element(tag):
+            nonlocal builder
+            path.pop()
+            if builder is not None:
+                builder.end(tag)
+            if path == TRACKS_PATH:
+                self.entries.append(TrackEntry(tag, start, parser.CurrentByteIndex))
+                if builder is not None:
+                    track_summaries.append(Track(builder.close()).summary())
+                    builder = None
+
+        def character_data(data):
+            if builder is not None:
+                builder.data(data)
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = character_data
+
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            if copy_to is not None:
+                copy_to.write(chunk)
+            parser.Parse(chunk, False)
+        parser.Parse(b'', True)
+
+        if summary is None:
+            summary = VersionSummary(track_summaries, id_counts)
+        return summary
+
+    def scan_natively(self, summary=None):
+        """
+        scan() of the source with lxml, falling back to scan() where
+        the tracks cannot be found in the XML
+        """
+        self.source.seek(0)
+        context = ET.iterparse(
+            self.source, events=('end',), tag=TRACK_TAGS,
+            huge_tree=True, remove_comments=True, remove_pis=True
+        )
+        tracks = []
+        id_counts = {}
+        track_summaries = []
+        for _, elem in context:
+            parent = elem.getparent()
+            if parent is None or parent.tag != TRACKS_PATH[-1]:
+                continue
+            tracks.append((elem.tag, elem.attrib['Id']))
+            if summary is None:
+                track_summaries.append(Track(elem).summary())
+                count_ids(elem, id_counts)
+            # Only where it is is kept
+            elem.clear()
+        root = context.root
+
+        located = None
+        live_set = root.find(TRACKS_PATH[1])
+        tracks_elem = live_set.find(TRACKS_PATH[2]) if live_set is not None else None
+        if tracks_elem is not None and len(tracks_elem) == len(tracks):
+            self.source.flush()
+            with mmap.mmap(self.source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                located = locate_tracks(data, tracks)
+        if located is None:
+            self.source.seek(0)
+            return self.scan(self.source, summary)
+
+        # The end is the > of the end tag
+        self.entries = [TrackEntry(tag, start, end - 1) for (tag, _), (start, end) in zip(tracks, located[0])]
+        self.root = ET.Element(root.tag, dict(root.attrib))
+        ET.SubElement(ET.SubElement(self.root, live_set.tag, dict(live_set.attrib)), tracks_elem.tag, dict(tracks_elem.attrib))
+        if summary is None:
+            # The rest of the set, the tracks having been cleared
+            count_ids(root, id_counts)
+            summary = VersionSummary(track_summaries, id_counts)
+        return summary
+
+    def read_track(self, entry):
+        """
+        Parses the track at entry, with the whitespace after it
+        """
+        self.source.seek(entry.start)
+        data = self.source.read(entry.end - entry.start)
+        # The end tag, and the whitespace after it, are past entry.end
+        while True:
+            chunk = self.source.read(READ_AHEAD)
+            data += chunk
+            close = data.find(b'>', entry.end - entry.start)
+            next_tag = data.find(b'<', close + 1) if close != -1 else -1
+            if next_tag != -1 or not chunk:
+                break
+        if close == -1:
+            raise ValueError('Track at ' + str(entry.start) + ' is not closed')
+
+        elem = xmlbackend.fromstring(data[:close + 1])
+        elem.tail = data[close + 1:next_tag if next_tag != -1 else len(data)].decode()
+        return elem
+
+    def layout(self):
+        """
+        Where the tracks are, as the layout of a VersionSummary of the set
+        """
+        return [tuple(entry) for entry in self.entries], ET.tostring(self.root)
+
+    def version(self):
+        """
+        A Version of the set whose tracks are read on first use
+        """
+        tracks = [
+            Track(None, s, load=lambda entry=entry: self.read_track(entry), tag=entry.tag)
+                for entry, s in zip(self.entries, self.summary.tracks)
+        ]
+        return Version(self.root, self.summary, tracks=tracks, source=self)
+
+    def close(self):
+        self.source.close()
+        if self.copy_path is not None:
+            os.remove(self.copy_path)
+
+
+def count_ids(elem, id_counts):
+    # Adds the ids of the collidable elements of elem to id_counts
+    for node in xmlbackend.iter_tags(elem, COLLIDABLE_TAGS):
+        id_ = int(node.attrib['Id'])
+        id_counts[id_] = id_counts.get(id_, 0) + 1
@@ -0,0 +1,128 @@
+import unittest
+import gzip
+import pickle
+import shutil
+import tempfile
+import os, sys
+from unittest import mock
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+import loader
+from xmlbackend import ET
+from cache import SummaryCache, MemoryCache
+from stream import StreamedSet
+from version import VersionSummary
+
+class SummaryCacheTestCase(unittest.TestCase):
+
+    file_test_version_1_A = "test_data/test_version_1_A.xml"
+    file_test_version_2_A = "test_data/test_version_2_A.xml"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = SummaryCache(os.path.join(self.temp_dir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_loaded_versions_are_cached_by_content(self):
+        copy = os.path.join(self.temp_dir, 'copy.xml')
+        shutil.copy(self.file_test_version_1_A, copy)
+
+        version, = loader.load_versions([self.file_test_version_1_A], cache=self.cache)
+        summary = self.cache.get(self.cache.key(copy))
+        self.assertIsNotNone(summary)
+
+        cached_version, = loader.load_versions([copy], cache=self.cache)
+        self.assertEqual(
+            [(t.track_id, t.return_map, t.fingerprint) for t in version.tracks],
+            [(t.track_id, t.return_map, t.fingerprint) for t in cached_version.tracks]
+        )
+        self.assertEqual(cached_version.id_index.used, summary.ids)
+
+    def test_streamed_sets_are_not_read_through_again(self):
+        gzipped = os.path.join(self.temp_dir, 'set.als')
+        with open(self.file_test_version_2_A, 'rb') as f_in, gzip.open(gzipped, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        filenames = [self.file_test_version_1_A, self.file_test_version_2_A, gzipped]
+
+        loaded = loader.load_versions(filenames, cache=self.cache, stream=True)
+        self.assertIsNotNone(self.cache.get(self.cache.key(gzipped)).layout)
+        with mock.patch.object(StreamedSet, 'scan', side_effect=AssertionError), \
+                mock.patch.object(StreamedSet, 'scan_natively', side_effect=AssertionError):
+            cached = loader.load_versions(filenames, cache=self.cache, stream=True)
+        try:
+            for version, cached_version in zip(loaded[1:], cached[1:]):
+                self.assertEqual(
+                    [ET.tostring(t.elem) for t in version.tracks],
+                    [ET.tostring(t.elem) for t in cached_version.tracks]
+                )
+        finally:
+            for version in loaded + cached:
+                version.close()
+
+    def test_memory_cache_alone_saves_reading_through(self):
+        memory = MemoryCache()
+        filenames = [self.file_test_version_1_A, self.file_test_version_2_A]
+        for version in loader.load_versions(filenames, cache=memory, stream=True):
+            version.close()
+        with mock.patch.object(StreamedSet, 'scan', side_effect=AssertionError), \
+                mock.patch.object(StreamedSet, 'scan_natively', side_effect=AssertionError):
+            for version in loader.load_versions(filenames, cache=memory, stream=True):
+                version.close()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        loader.load_versions([self.file_test_version_1_A], cache=self.cache)
+        entry_path = self.cache.path(self.cache.key(self.file_test_version_1_A))
+        os.utime(entry_path, (0, 0))
+        self.cache.max_bytes = os.path.getsize(entry_path) * 1.5
+
+        loader.load_versions([self.file_test_version_2_A], cache=self.cache)
+        self.assertFalse(self.cache.contains(self.cache.key(self.file_test_version_1_A)))
+        self.assertTrue(self.cache.contains(self.cache.key(self.file_test_version_2_A)))
+
+    def test_unreadable_entries_are_discarded(self):
+        key = self.cache.key(self.file_test_version_1_A)
+        os.makedirs(self.cache.folder)
+        with open(self.cache.path(key), 'wb') as f:
+            f.write(b'not a pickle')
+        self.assertIsNone(self.cache.get(key))
+        self.assertFalse(self.cache.contains(key))
+
+    def test_entries_of_another_summary_shape_are_discarded(self):
+        class OldSummary():
+            def __reduce__(self):
+                return (VersionSummary, ([], {}, None, 'removed field'))
+
+        key = self.cache.key(self.file_test_version_1_A)
+        os.makedirs(self.cache.folder)
+        with open(self.cache.path(key), 'wb') as f:
+            pickle.dump(OldSummary(), f)
+        self.assertIsNone(self.cache.get(key))
+        self.assertFalse(self.cache.contains(key))
+
+    def test_keys_change_with_the_summary_format(self):
+        key = self.cache.key(self.file_test_version_1_A)
+        with mock.patch('cache.SUMMARY_FORMAT', 1000):
+            self.assertNotEqual(self.cache.key(self.file_test_version_1_A), key)
+
+    def test_memory_cache_keeps_recent_summaries_in_front_of_backing(self):
+        memory = MemoryCache(self.cache, max_entries=1)
+        loader.load_versions([self.file_test_version_1_A], cache=memory)
+        key = memory.key(self.file_test_version_1_A)
+        self.assertTrue(self.cache.contains(key))
+
+        # Each get is a copy that can be changed
+        summary = memory.get(key)
+        self.assertIsNot(memory.get(key), summary)
+        self.assertEqual(memory.get(key).ids, summary.ids)
+
+        loader.load_versions([self.file_test_version_2_A], cache=memory)
+        self.assertEqual(list(memory.entries), [memory.key(self.file_test_version_2_A)])
+        self.assertTrue(memory.contains(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import gzip
+import shutil
+import tempfile
+import threading
+import time
+import os, sys
+from unittest import mock
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+from xmlbackend import ET
+from conflict import Conflict, PreviewBuilder
+from version import Version
+import wait
+
+class PreviewBuilderTestCase(unittest.TestCase):
+
+    file_blank = "blank.xml"
+    file_test_version_1_A = "test_data/test_version_1_A.xml"
+    file_test_version_2_A = "test_data/test_version_2_A.xml"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.builder = PreviewBuilder(self.file_blank)
+        self.version_1 = Version(ET.parse(self.file_test_version_1_A).getroot())
+        self.version_2 = Version(ET.parse(self.file_test_version_2_A).getroot())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_conflict(self, id_):
+        return Conflict(*[v.get_track_with_id(id_).elem for v in (self.version_1, self.version_1, self.version_2)])
+
+    def test_preview_holds_both_sides_without_sends(self):
+        conflict = self.make_conflict(12)
+        original = ET.tostring(conflict.ours)
+
+        tracks = self.builder.build(conflict).find('LiveSet').find('Tracks')
+        self.assertEqual([t.attrib['Id'] for t in tracks], ["10", "20"])
+        self.assertEqual(
+            [t.find('Name').find('UserName').attrib['Value'] for t in tracks], ['Ours', 'Theirs']
+        )
+        for t in tracks:
+            self.assertEqual(len(t.find('DeviceChain').find('Mixer').find('Sends')), 0)
+
+        # The conflicting tracks and the template are left as they were
+        self.assertEqual(ET.tostring(conflict.ours), original)
+        self.assertEqual(len(self.builder.template.find('LiveSet').find('Tracks')), 1)
+
+    def test_template_is_parsed_once(self):
+        self.assertIs(PreviewBuilder(self.file_blank).template, self.builder.template)
+
+    def test_write_all_writes_gzipped_previews(self):
+        conflicts = [self.make_conflict(12), self.make_conflict(13)]
+        folder = os.path.join(self.temp_dir, 'conftemp')
+
+        paths = self.builder.write_all(conflicts, folder)
+
+        self.assertEqual(paths, [folder + '/conf_0.als', folder + '/conf_1.als'])
+        for path in paths:
+            with gzip.open(path, 'rb') as f:
+                root = ET.parse(f).getroot()
+            self.assertEqual(len(root.find('LiveSet').find('Tracks')), 2)
+
+
+class ConflictResolutionTestCase(unittest.TestCase):
+
+    file_blank = os.path.abspath("blank.xml")
+    file_test_version_1_A = os.path.abspath("test_data/test_version_1_A.xml")
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.temp_dir, '.merge'))
+        shutil.copy(self.file_blank, os.path.join(self.temp_dir, '.merge', 'blank.xml'))
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+
+        # Both branches add to the name of track 12
+        self.base, self.ours, self.theirs = [
+            Version(ET.parse(self.file_test_version_1_A).getroot()) for _ in range(3)
+        ]
+        for version, count in ((self.ours, 1), (self.theirs, 2)):
+            name = version.get_track_with_id(12).elem.find('Name')
+            for _ in range(count):
+                ET.SubElement(name, 'Extra')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.temp_dir)
+
+    def write_done(self, contents):
+        with open('.merge/done', 'w') as f:
+            f.write(contents)
+
+    def name_length(self, version):
+        return len(version.get_track_with_id(12).elem.find('Name'))
+
+    def test_resolution_left_from_an_earlier_merge_is_not_used(self):
+        self.write_done('{"conf_0.als": false}')
+
+        def resolve(url):
+            # The resolver picks ours a little later
+            threading.Thread(target=lambda: (time.sleep(0.2), self.write_done('{"conf_0.als": true}'))).start()
+
+        with mock.patch('webbrowser.open', resolve):
+            self.base.merge_with(self.ours, self.theirs, resolve_timeout=5)
+
+        self.assertEqual(self.name_length(self.base), self.name_length(self.ours))
+        self.assertFalse(os.path.exists('.merge/done'))
+
+    def test_invalid_resolution_is_removed(self):
+        def resolve(url):
+            self.write_done('{"conf_0.als": ')
+
+        with mock.patch('webbrowser.open', resolve), mock.patch('wait.SETTLE_TIME', 0.1):
+            with self.assertRaises(wait.ResolutionTimeout):
+                self.base.merge_with(self.ours, self.theirs)
+
+        self.assertFalse(os.path.exists('.merge/done'))
+        self.assertFalse(os.path.exists('.conftemp'))
+
+
+if __name__ == '__main__':
+    unittest.main()
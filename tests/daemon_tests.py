@@ -0,0 +1,108 @@
+import unittest
+import contextlib
+import io
+import json
+import shutil
+import tempfile
+import threading
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+from xmlbackend import ET
+import daemon
+import mergeserver
+import merge
+import xmlbackend
+
+class DaemonTestCase(unittest.TestCase):
+
+    file_test_version_1_A = "test_data/test_version_1_A.xml"
+    file_test_version_2_A = "test_data/test_version_2_A.xml"
+    file_test_version_2_B = "test_data/test_version_2_B.xml"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.temp_dir, 'daemon.sock')
+        self.args = [self.file_test_version_1_A, self.file_test_version_2_A, self.file_test_version_2_B]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def serve(self, requests):
+        server = mergeserver.MergeServer(self.socket_path)
+        thread = threading.Thread(target=lambda: [server.handle_request() for _ in range(requests)])
+        thread.start()
+        return server, thread
+
+    def test_request_is_merged_by_the_daemon(self):
+        output = os.path.join(self.temp_dir, 'out.xml')
+        server, thread = self.serve(2)
+        try:
+            self.assertEqual(daemon.request(self.args + [output], self.socket_path), 0)
+            # Reported rather than exiting the daemon
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr):
+                self.assertEqual(daemon.request(self.args, self.socket_path), -1)
+            self.assertIn('three files', stderr.getvalue())
+        finally:
+            thread.join()
+            server.server_close()
+
+        tracks = ET.parse(output).getroot().find('LiveSet').find('Tracks')
+        self.assertTrue(len(tracks) > 0)
+        # The summaries of the sets are kept for the next merge
+        self.assertEqual(len(server.memory_cache.entries), 3)
+
+    def test_request_environment_is_used_for_the_merge(self):
+        output = os.path.join(self.temp_dir, 'out.xml')
+        trace_file = os.path.join(self.temp_dir, 'trace.jsonl')
+        server, thread = self.serve(1)
+        try:
+            os.environ['ALS_MERGE_TRACE'] = trace_file
+            try:
+                self.assertEqual(daemon.request(self.args + [output], self.socket_path), 0)
+            finally:
+                del os.environ['ALS_MERGE_TRACE']
+        finally:
+            thread.join()
+            server.server_close()
+
+        with open(trace_file) as f:
+            trace = json.loads(f.readline())
+        self.assertEqual(trace['argv'], self.args + [output])
+        # Only set for the merge
+        self.assertNotIn('ALS_MERGE_TRACE', os.environ)
+
+    def test_merge_with_another_xml_backend_is_not_run(self):
+        server = mergeserver.MergeServer(self.socket_path)
+        try:
+            other = xmlbackend.ETREE if xmlbackend.NAME == xmlbackend.LXML else xmlbackend.LXML
+            status, _ = server.merge(self.args, os.getcwd(), {xmlbackend.BACKEND_ENV: other})
+            self.assertIsNone(status)
+        finally:
+            server.server_close()
+
+    def test_merges_in_process_without_a_daemon(self):
+        output = os.path.join(self.temp_dir, 'out.xml')
+        self.assertIsNone(daemon.request(self.args + [output], self.socket_path))
+
+        merge.run(self.args + [output, '--daemon-socket', self.socket_path])
+        self.assertTrue(os.path.exists(output))
+
+    def test_daemon_does_not_take_the_next_argument(self):
+        output = os.path.join(self.temp_dir, 'out.xml')
+        cwd = os.getcwd()
+        args = [os.path.abspath(f) for f in self.args]
+        # No daemon listens in the temporary folder
+        os.chdir(self.temp_dir)
+        try:
+            merge.run(['--daemon'] + args + [output])
+        finally:
+            os.chdir(cwd)
+        self.assertTrue(os.path.exists(output))
+
+
+if __name__ == '__main__':
+    unittest.main()
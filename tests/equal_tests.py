@@ -1,10 +1,11 @@
 import unittest
-import xml.etree.ElementTree as ET
+import warnings
 import os, sys
 # Add the directory above this file to the path
 CODE_DIR = os.path.dirname(__file__)+"/.."
 sys.path.append(CODE_DIR)
 
+from xmlbackend import ET
 import equal
 
 class TreeEqualTestCase(unittest.TestCase):
@@ -14,7 +15,7 @@ class TreeEqualTestCase(unittest.TestCase):
     file_test_equal_2_A = 'test_data/test_equal_2_A.xml'
 
     def load_xml_string_from_file(self, filename):
-        with open(filename, 'r') as f:
+        with open(filename, 'rb') as f:
             file_string = f.read()
             return file_string
 
@@ -41,11 +42,73 @@ class TreeEqualTestCase(unittest.TestCase):
         self.assertNotEqual(root_a, root_b)
         self.assertTrue(equal.tree_equal(root_a, root_b, []))
     
+    def test_fingerprint_equal_agrees_with_tree_equal(self):
+        str_a = self.load_xml_string_from_file(self.file_test_equal_1_A)
+        str_b = self.load_xml_string_from_file(self.file_test_equal_1_B)
+        str_c = self.load_xml_string_from_file(self.file_test_equal_2_A)
+        tracks = [ET.fromstring(s) for s in (str_a, str_b, str_c)]
+        send_maps = [{}, {0: 0, 1: 1}, {0: 1, 1: 0}]
+        for t1 in tracks:
+            for t2 in tracks:
+                for send_map in send_maps:
+                    self.assertEqual(
+                        equal.tree_equal(t1, t2, send_map),
+                        equal.fingerprint_equal(equal.fingerprint(t1), equal.fingerprint(t2), send_map)
+                    )
+
+    def test_diff_reports_each_difference(self):
+        str_a = self.load_xml_string_from_file(self.file_test_equal_2_A)
+        str_b = self.load_xml_string_from_file(self.file_test_equal_1_A)
+        root_a = ET.fromstring(str_a)
+        root_b = ET.fromstring(str_b)
+
+        report = equal.DiffReport()
+        self.assertFalse(equal.tree_equal(root_a, root_b, [], report))
+        self.assertEqual(report.differences[0], ('MidiTrack/@Id', equal.ATTRIB, '12', '13'))
+        self.assertIn(
+            ('MidiTrack/DeviceChain[1]/Mixer[1]/Sends[1]', equal.LEN, 2, 3), report.differences
+        )
+        self.assertEqual(report.differences, equal.diff(root_a, root_b, []))
+
+        str_c = self.load_xml_string_from_file(self.file_test_equal_1_B)
+        self.assertEqual(equal.diff(root_b, ET.fromstring(str_c), []), [])
+
+    def test_deep_trees_compared_without_recursion(self):
+        def chain(depth, value):
+            root = elem = ET.Element('DeviceChain')
+            for _ in range(depth):
+                elem = ET.SubElement(elem, 'DeviceChain', Value=value)
+            ET.SubElement(elem, 'Devices')
+            return root
+
+        depth = sys.getrecursionlimit() * 2
+        self.assertTrue(equal.tree_equal(chain(depth, '1'), chain(depth, '1'), []))
+        self.assertFalse(equal.tree_equal(chain(depth, '1'), chain(depth, '2'), []))
+
+    def test_attrib_equal_leaves_out_ignored_keys(self):
+        ignored = equal.IGNORED_ATTRIB['EffectiveName']
+        self.assertTrue(equal.attrib_equal({'Value': 'a'}, {'Value': 'b'}, ignored))
+        self.assertTrue(equal.attrib_equal({'Value': 'a'}, {}, ignored))
+        self.assertFalse(equal.attrib_equal({'Value': 'a', 'Id': '1'}, {'Value': 'a'}, ignored))
+        self.assertFalse(equal.attrib_equal({'Value': 'a'}, {'Value': 'b'}, equal.NOTHING_IGNORED))
+
     def test_empty_trees_equal(self):
         empty_a = ET.ElementTree().getroot()
         empty_b = ET.ElementTree().getroot()
         self.assertTrue(equal.tree_equal(empty_a, empty_b, []))
 
+    def test_elements_are_not_truth_tested(self):
+        leaf = ET.fromstring(b'<A />')
+        parent = ET.fromstring(b'<A><B /></A>')
+        # lxml warns when an element is truth-tested
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            self.assertTrue(equal.tree_equal(leaf, ET.fromstring(b'<C />'), []))
+            self.assertFalse(equal.tree_equal(leaf, parent, []))
+            self.assertTrue(equal.tree_equal(None, leaf, []))
+            self.assertFalse(equal.tree_equal(None, parent, []))
+            self.assertFalse(equal.tree_equal(leaf, parent, [], report=equal.DiffReport()))
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,66 @@
+import unittest
+import gzip
+import shutil
+import tempfile
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+import alsfile
+import fastpath
+import merge
+
+class FastPathTestCase(unittest.TestCase):
+
+    file_test_version_1_A = "test_data/test_version_1_A.xml"
+    file_test_version_2_A = "test_data/test_version_2_A.xml"
+    file_test_version_2_B = "test_data/test_version_2_B.xml"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def gzip_to_temp(self, filename, name, mtime=0):
+        path = os.path.join(self.temp_dir, name)
+        with open(filename, 'rb') as f_in, gzip.GzipFile(path, 'wb', mtime=mtime) as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        return path
+
+    def test_unchanged_side(self):
+        a, b, c = self.file_test_version_1_A, self.file_test_version_2_A, self.file_test_version_2_B
+        self.assertEqual(fastpath.unchanged_side(a, a, b), fastpath.THEIRS)
+        self.assertEqual(fastpath.unchanged_side(a, b, a), fastpath.OURS)
+        self.assertEqual(fastpath.unchanged_side(a, b, b), fastpath.OURS)
+        self.assertIsNone(fastpath.unchanged_side(a, b, c))
+
+    def test_unchanged_side_compares_decompressed_sets(self):
+        base = self.gzip_to_temp(self.file_test_version_1_A, 'base', mtime=1)
+        ours = self.gzip_to_temp(self.file_test_version_1_A, 'ours', mtime=2)
+        theirs = self.gzip_to_temp(self.file_test_version_2_A, 'theirs')
+        self.assertEqual(fastpath.unchanged_side(base, ours, theirs), fastpath.THEIRS)
+
+    def test_run_copies_theirs_when_ours_is_unchanged(self):
+        base = self.gzip_to_temp(self.file_test_version_1_A, 'base', mtime=1)
+        ours = self.gzip_to_temp(self.file_test_version_1_A, 'ours', mtime=2)
+        theirs = self.gzip_to_temp(self.file_test_version_2_A, 'theirs')
+
+        merge.run([base, ours, theirs, ours])
+
+        with open(ours, 'rb') as f_ours, open(theirs, 'rb') as f_theirs:
+            self.assertEqual(f_ours.read(), f_theirs.read())
+
+    def test_write_matches_the_output_format(self):
+        output = os.path.join(self.temp_dir, 'out.als')
+        fastpath.write(self.file_test_version_2_A, output, compress=True)
+
+        self.assertTrue(alsfile.is_gzipped(output))
+        self.assertEqual(
+            alsfile.content_digest(output), alsfile.content_digest(self.file_test_version_2_A)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
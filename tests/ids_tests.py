@@ -0,0 +1,34 @@
+import unittest
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+from xmlbackend import ET
+import ids
+
+class IdAllocatorTestCase(unittest.TestCase):
+
+    def test_claim_reports_used_ids(self):
+        allocator = ids.IdAllocator([3, 5])
+        self.assertFalse(allocator.claim(3))
+        self.assertTrue(allocator.claim(4))
+        self.assertFalse(allocator.claim(4))
+
+    def test_block_starts_after_highest_id(self):
+        allocator = ids.IdAllocator([3, 10, 5])
+        self.assertEqual(list(allocator.block(3)), [11, 12, 13])
+        self.assertEqual(list(allocator.block(1)), [14])
+        self.assertFalse(allocator.claim(12))
+
+    def test_amend_collisions_renumbers_later_duplicates(self):
+        root = ET.fromstring(
+            '<Track><A Id="1"><A Id="2" /></A><B Id="1" /><A Id="2" /><C Id="1" /></Track>'
+        )
+        renumbered = ids.amend_collisions(ids.tagged(root, {'A', 'B'}), ids.IdAllocator())
+        self.assertEqual(len(renumbered), 2)
+        self.assertEqual([n.attrib['Id'] for n in root.iter() if 'Id' in n.attrib], ['1', '2', '3', '4', '1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import gzip
+import shutil
+import tempfile
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+from xmlbackend import ET
+import loader
+
+class LoaderTestCase(unittest.TestCase):
+
+    file_test_version_1_A = "test_data/test_version_1_A.xml"
+    file_test_version_2_A = "test_data/test_version_2_A.xml"
+    file_test_version_2_B = "test_data/test_version_2_B.xml"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_parallel_load_matches_serial_load(self):
+        # Gzipped, so that the workers make copies of the XML
+        gzipped = os.path.join(self.temp_dir, 'set.als')
+        with open(self.file_test_version_2_B, 'rb') as f_in, gzip.open(gzipped, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        filenames = [
+            self.file_test_version_1_A,
+            self.file_test_version_2_A,
+            gzipped,
+        ]
+        serial = loader.load_versions(filenames, stream=True)
+        parallel = loader.load_versions(filenames, jobs=3, stream=True)
+
+        try:
+            for serial_version, parallel_version in zip(serial, parallel):
+                self.assertEqual(
+                    [(t.track_id, t.type, t.return_map) for t in serial_version.tracks],
+                    [(t.track_id, t.type, t.return_map) for t in parallel_version.tracks]
+                )
+                self.assertEqual(
+                    [ET.tostring(t.elem) for t in serial_version.tracks],
+                    [ET.tostring(t.elem) for t in parallel_version.tracks]
+                )
+        finally:
+            copy_path = parallel[2].source.copy_path
+            for version in serial + parallel:
+                version.close()
+        self.assertFalse(os.path.exists(copy_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import gzip
+import shutil
+import tempfile
+import os, sys
+from unittest import mock
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+from xmlbackend import ET
+import merge
+import alsfile
+import loader
+from version import Version
+from wait import ResolutionTimeout
+
+class MergeRunTestCase(unittest.TestCase):
+
+    file_test_version_1_A = "test_data/test_version_1_A.xml"
+    file_test_version_2_A = "test_data/test_version_2_A.xml"
+    file_test_version_2_B = "test_data/test_version_2_B.xml"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def gzip_to_temp(self, filename, name):
+        path = os.path.join(self.temp_dir, name)
+        with open(filename, 'rb') as f_in, gzip.open(path, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        return path
+
+    def effective_names(self, root):
+        return [
+            t.find('Name').find('EffectiveName').attrib['Value']
+                for t in root.find('LiveSet').find('Tracks')
+        ]
+
+    def test_run_merges_gzipped_sets_in_place(self):
+        base = self.gzip_to_temp(self.file_test_version_1_A, 'base')
+        ours = self.gzip_to_temp(self.file_test_version_2_A, 'ours')
+        theirs = self.gzip_to_temp(self.file_test_version_2_B, 'theirs')
+
+        merge.run([base, ours, theirs, ours])
+
+        self.assertTrue(alsfile.is_gzipped(ours))
+        with gzip.open(ours, 'rb') as f:
+            names = self.effective_names(ET.parse(f).getroot())
+        self.assertTrue(any("Campfire" in n for n in names))
+        self.assertTrue(any("Bright Marimba" in n for n in names))
+
+    def test_run_writes_plain_xml_for_plain_inputs(self):
+        output = os.path.join(self.temp_dir, 'merged.xml')
+
+        merge.run([
+            self.file_test_version_1_A,
+            self.file_test_version_2_A,
+            self.file_test_version_2_B,
+            output,
+        ])
+
+        self.assertFalse(alsfile.is_gzipped(output))
+        names = self.effective_names(ET.parse(output).getroot())
+        self.assertTrue(any("Campfire" in n for n in names))
+
+    def test_load_roots_copies_repeated_files(self):
+        root_a, root_b, root_c = alsfile.load_roots(
+            self.file_test_version_1_A,
+            self.file_test_version_2_A,
+            self.file_test_version_1_A,
+        )
+        self.assertIsNot(root_a, root_c)
+        self.assertEqual(ET.tostring(root_a), ET.tostring(root_c))
+        self.assertNotEqual(ET.tostring(root_a), ET.tostring(root_b))
+
+    def test_versions_are_closed_when_the_merge_fails(self):
+        output = os.path.join(self.temp_dir, 'out.xml')
+        loaded = []
+        load = loader.load_versions
+
+        def load_versions(*args, **kwargs):
+            loaded.extend(load(*args, **kwargs))
+            return loaded
+
+        for error in (ResolutionTimeout('Timed out'), ValueError('Failed')):
+            del loaded[:]
+            with mock.patch('loader.load_versions', load_versions), \
+                    mock.patch.object(Version, 'merge_with', side_effect=error), \
+                    mock.patch('sys.stderr'):
+                with self.assertRaises((SystemExit, ValueError)):
+                    merge.run([self.file_test_version_1_A, self.file_test_version_2_A, self.file_test_version_2_B, output])
+            self.assertEqual(len(loaded), 3)
+            self.assertTrue(all(version.source is None for version in loaded))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+from xmlbackend import ET
+import merkle
+from version import Track
+
+class MerkleTestCase(unittest.TestCase):
+
+    file_test_equal_1_A = 'test_data/test_equal_1_A.xml'
+
+    def setUp(self):
+        with open(self.file_test_equal_1_A, 'rb') as f:
+            self.track_string = f.read()
+        self.base = ET.fromstring(self.track_string)
+        self.ours = ET.fromstring(self.track_string)
+        self.theirs = ET.fromstring(self.track_string)
+
+    def add_child(self, parent, tag, count=1):
+        for _ in range(count):
+            ET.SubElement(parent, tag, {'Value': '1'})
+
+    def test_identical_trees_have_no_changed_subtrees(self):
+        changed = merkle.changed_subtrees(merkle.MerkleNode(self.base), merkle.MerkleNode(self.ours))
+        self.assertEqual(changed, {})
+
+    def test_changed_subtree_is_located(self):
+        self.add_child(self.ours.find('TrackDelay'), 'Extra')
+        changed = merkle.changed_subtrees(merkle.MerkleNode(self.base), merkle.MerkleNode(self.ours))
+        self.assertEqual(list(changed), [(list(self.base).index(self.base.find('TrackDelay')),)])
+
+    def test_merge3_combines_separate_changes(self):
+        self.add_child(self.ours.find('TrackDelay'), 'Extra')
+        self.add_child(self.theirs.find('Name'), 'Extra')
+        replacements = merkle.merge3(
+            merkle.MerkleNode(self.base), merkle.MerkleNode(self.ours), merkle.MerkleNode(self.theirs)
+        )
+        self.assertEqual(len(replacements), 2)
+
+        merkle.apply(self.base, replacements)
+        self.assertEqual(len(self.base.find('TrackDelay')), len(self.ours.find('TrackDelay')))
+        self.assertEqual(len(self.base.find('Name')), len(self.theirs.find('Name')))
+
+    def test_merge3_rejects_overlapping_changes(self):
+        self.add_child(self.ours.find('Name'), 'Extra')
+        self.add_child(self.theirs.find('Name'), 'Extra', count=2)
+        replacements = merkle.merge3(
+            merkle.MerkleNode(self.base), merkle.MerkleNode(self.ours), merkle.MerkleNode(self.theirs)
+        )
+        self.assertIsNone(replacements)
+
+    def test_merge3_keeps_changes_to_childless_elements(self):
+        # Ours renames the track and changes a value, theirs changes
+        # another subtree
+        self.ours.find('Name').find('UserName').attrib['Value'] = 'Renamed'
+        self.ours.find('TrackDelay').find('Value').attrib['Value'] = '5'
+        self.add_child(self.theirs.find('DeviceChain'), 'Extra')
+        tracks = []
+        for elem in (self.base, self.ours, self.theirs):
+            track = Track(elem)
+            track.set_return_map({})
+            tracks.append(track)
+        base, ours, theirs = tracks
+
+        self.assertEqual(len(base.merge_with(ours, theirs)), 3)
+        self.assertEqual(self.base.find('Name').find('UserName').attrib['Value'], 'Renamed')
+        self.assertEqual(self.base.find('TrackDelay').find('Value').attrib['Value'], '5')
+        self.assertEqual(len(self.base.find('DeviceChain')), len(self.theirs.find('DeviceChain')))
+
+    def test_merge3_rejects_different_changes_to_a_childless_element(self):
+        self.ours.find('Name').find('UserName').attrib['Value'] = 'Ours'
+        self.theirs.find('Name').find('UserName').attrib['Value'] = 'Theirs'
+        replacements = merkle.merge3(
+            merkle.MerkleNode(self.base), merkle.MerkleNode(self.ours), merkle.MerkleNode(self.theirs)
+        )
+        self.assertIsNone(replacements)
+
+    def test_track_merge_with_merges_send_values(self):
+        base = Track(self.base)
+        ours = Track(self.ours)
+        theirs = Track(self.theirs)
+        base.set_return_map({2: 0.5, 16: 0.5})
+        ours.set_return_map({2: 1.0, 16: 0.5})
+        theirs.set_return_map({2: 0.5, 16: 0.25})
+        self.add_child(self.ours.find('TrackDelay'), 'Extra')
+        self.add_child(self.theirs.find('Name'), 'Extra')
+
+        self.assertEqual(len(base.merge_with(ours, theirs)), 2)
+        self.assertEqual(base.return_map, {2: 1.0, 16: 0.25})
+
+        ours.set_return_map({2: 0.0, 16: 0.5})
+        self.assertIsNone(base.merge_with(ours, theirs))
+
+
+if __name__ == '__main__':
+    unittest.main()
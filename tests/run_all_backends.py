@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the tests once with each XML backend that is installed, as
+xmlbackend chooses one when it is first imported.
+
+    python tests/run_all_backends.py
+
+Exits with a failure if the tests fail with any of them
+"""
+import importlib.util
+import os
+import subprocess
+import sys
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(CODE_DIR)
+
+import xmlbackend
+
+
+def available_backends():
+    backends = [xmlbackend.ETREE]
+    if importlib.util.find_spec('lxml') is not None:
+        backends.append(xmlbackend.LXML)
+    return backends
+
+
+def main():
+    failed = []
+    for backend in available_backends():
+        sys.stderr.write('Testing with ' + backend + '\n')
+        env = dict(os.environ, **{xmlbackend.BACKEND_ENV: backend})
+        result = subprocess.run(
+            [sys.executable, '-m', 'unittest', 'discover', '-s', 'tests', '-p', '*tests.py'],
+            cwd=CODE_DIR, env=env
+        )
+        if result.returncode:
+            failed.append(backend)
+
+    if xmlbackend.LXML not in available_backends():
+        sys.stderr.write('lxml is not installed, only ' + xmlbackend.ETREE + ' was tested\n')
+    if failed:
+        sys.stderr.write('Failed with ' + ', '.join(failed) + '\n')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import unittest
+import itertools
+import os, sys
+from unittest import mock
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+import sends
+
+class SendsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Return tracks 2 and 16, and a third track 2 as merged
+        # from a branch before its id is changed
+        self.matrix = sends.SendMatrix.from_positions(
+            [2, 16, 2], [{0: 0.5, 1: 1.0}, {1: 0.25}, {0: 0.5, 1: 0.5, 2: 0.75}]
+        )
+
+    def test_rows_are_return_maps(self):
+        first, second, third = self.matrix.rows()
+        self.assertEqual(first, {2: 0.5, 16: 1.0})
+        self.assertEqual(second, {16: 0.25})
+        # The last send to a repeated return track is kept
+        self.assertEqual(third, {2: 0.75, 16: 0.5})
+
+        second[2] = 0.125
+        del first[16]
+        self.assertEqual(dict(second), {2: 0.125, 16: 0.25})
+        self.assertNotIn(16, first)
+        with self.assertRaises(KeyError):
+            del first[16]
+
+        # A new return track takes the row out of the matrix
+        first[3] = 1.0
+        self.assertEqual(first, {2: 0.5, 3: 1.0})
+        self.assertEqual(self.matrix.rows()[0], {2: 0.5})
+
+    def test_gather_orders_sends_by_return_track(self):
+        rows = self.matrix.rows() + [{16: 0.5}]
+        self.assertEqual(
+            sends.gather(rows, [16, 3, 2, 2], default=0),
+            [[1.0, 0, 0.5, 0.5], [0.25, 0, 0, 0], [0.5, 0, 0.75, 0.75], [0.5, 0, 0, 0]]
+        )
+
+    def test_merge_of_rows_agrees_with_merge_of_dicts(self):
+        levels = [None, 0.0, 0.5]
+        columns = sends.Columns([1])
+        for b, o, t in itertools.product(levels, repeat=3):
+            rows = [
+                sends.SendRow(columns, sends.array('d', [sends.MISSING if v is None else v]))
+                    for v in (b, o, t)
+            ]
+            dicts = [{} if v is None else {1: v} for v in (b, o, t)]
+            merged = sends.merge(*rows)
+            expected = sends.merge(*dicts)
+            if expected is None:
+                self.assertIsNone(merged)
+            else:
+                self.assertIsInstance(merged, sends.SendRow)
+                self.assertEqual(merged, expected)
+
+    def test_small_matrices_use_array(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop(sends.BACKEND_ENV, None)
+            self.assertEqual(sends.backend_name(16), sends.ARRAY)
+            matrix = sends.SendMatrix.from_positions([2], [{0: 0.5}])
+        self.assertIsInstance(matrix.values, sends.array)
+
+    def test_rows_of_both_backends_are_merged_and_gathered(self):
+        if not sends._import_numpy():
+            self.skipTest('NumPy is not installed')
+        rows = []
+        for backend in (sends.NUMPY, sends.ARRAY, sends.ARRAY):
+            with mock.patch.dict(os.environ, {sends.BACKEND_ENV: backend}):
+                rows += sends.SendMatrix.from_positions([2, 16], [{0: 0.5}]).rows()
+        rows[2][16] = 0.25
+
+        self.assertEqual(sends.merge(*rows), {2: 0.5, 16: 0.25})
+        self.assertEqual(sends.gather(rows, [16, 2]), [[0.0, 0.5], [0.0, 0.5], [0.25, 0.5]])
+
+
+if __name__ == '__main__':
+    unittest.main()
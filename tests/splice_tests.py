@@ -0,0 +1,96 @@
+import unittest
+import shutil
+import tempfile
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+import alsfile
+from splice import SplicedSet, locate_tracks
+from version import Version
+
+class SpliceTestCase(unittest.TestCase):
+
+    file_test_version_1_A = "test_data/test_version_1_A.xml"
+    file_test_version_2_A = "test_data/test_version_2_A.xml"
+    file_test_version_2_B = "test_data/test_version_2_B.xml"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.temp_dir, 'out.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def elements(self, root):
+        return [(e.tag, e.attrib, (e.text or '').strip()) for e in root.iter()]
+
+    def write_with_comment_between_tracks(self):
+        # A set whose second track does not follow the end tag of the first
+        path = os.path.join(self.temp_dir, 'commented.xml')
+        with open(self.file_test_version_1_A, 'rb') as f:
+            data = f.read()
+        second = data.find(b'<MidiTrack', data.find(b'</MidiTrack>'))
+        with open(path, 'wb') as f:
+            f.write(data[:second] + b'<!-- moved -->' + data[second:])
+        return path
+
+    def test_unchanged_set_is_copied_as_it_is(self):
+        spliced = SplicedSet(self.file_test_version_1_A)
+        try:
+            spliced.write(spliced.version(), self.output)
+        finally:
+            spliced.close()
+        with open(self.file_test_version_1_A, 'rb') as f1, open(self.output, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_located_tracks_match_parsed_ranges(self):
+        spliced = SplicedSet(self.file_test_version_1_A)
+        try:
+            spliced.ranges = {}
+            spliced.file.seek(0)
+            tracks = spliced.parse(spliced.file).find('LiveSet').find('Tracks')
+            spliced.end_ranges()
+            located = locate_tracks(spliced.data, [(t.tag, t.attrib['Id']) for t in tracks])
+            self.assertEqual(located, ([spliced.ranges[t] for t in tracks], spliced.ranges[tracks]))
+        finally:
+            spliced.close()
+
+    def test_tracks_are_not_located_out_of_place(self):
+        path = self.write_with_comment_between_tracks()
+        with open(path, 'rb') as f:
+            data = f.read()
+        tracks = Version(alsfile.parse(path)).tracks
+        self.assertIsNone(locate_tracks(data, [(t.elem.tag, str(t.track_id)) for t in tracks]))
+
+    def test_set_with_tracks_out_of_place_is_spliced(self):
+        path = self.write_with_comment_between_tracks()
+        spliced = SplicedSet(path)
+        try:
+            self.assertTrue(spliced.can_splice(spliced.version()))
+            spliced.write(spliced.version(), self.output)
+        finally:
+            spliced.close()
+        self.assertEqual(self.elements(alsfile.parse(self.output)), self.elements(alsfile.parse(path)))
+
+    def test_merged_set_matches_full_write(self):
+        spliced = SplicedSet(self.file_test_version_1_A)
+        version = spliced.version()
+        expected = Version(alsfile.parse(self.file_test_version_1_A))
+        for base in [version, expected]:
+            base.merge_with(
+                Version(alsfile.parse(self.file_test_version_2_A)),
+                Version(alsfile.parse(self.file_test_version_2_B))
+            )
+        try:
+            spliced.write(version, self.output, compress=True)
+        finally:
+            spliced.close()
+
+        self.assertTrue(alsfile.is_gzipped(self.output))
+        self.assertEqual(self.elements(alsfile.parse(self.output)), self.elements(expected.tree))
+
+
+if __name__ == '__main__':
+    unittest.main()
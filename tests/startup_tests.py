@@ -0,0 +1,46 @@
+import unittest
+import json
+import shutil
+import subprocess
+import tempfile
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+# Modules only needed to show and resolve conflicts, or for --jobs
+ON_DEMAND = ['webbrowser', 'conflict', 'concurrent.futures', 'mergeserver']
+
+# Merges the sets given in a fresh interpreter and lists the
+# modules of ON_DEMAND that were imported
+MERGE = '''
+import json, sys
+import merge
+merge.run(sys.argv[1:])
+print(json.dumps([m for m in %r if m in sys.modules]))
+''' % ON_DEMAND
+
+class StartupTestCase(unittest.TestCase):
+
+    file_test_version_1_A = "test_data/test_version_1_A.xml"
+    file_test_version_2_A = "test_data/test_version_2_A.xml"
+    file_test_version_2_B = "test_data/test_version_2_B.xml"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_merge_without_conflicts_imports_only_what_it_needs(self):
+        output = os.path.join(self.temp_dir, 'out.xml')
+        imported = subprocess.check_output([
+            sys.executable, '-c', MERGE,
+            self.file_test_version_1_A, self.file_test_version_2_A, self.file_test_version_2_B, output,
+        ], cwd=CODE_DIR)
+        self.assertEqual(json.loads(imported), [])
+        self.assertTrue(os.path.exists(output))
+
+
+if __name__ == '__main__':
+    unittest.main()
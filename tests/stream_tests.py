@@ -0,0 +1,75 @@
+import unittest
+import gzip
+import shutil
+import tempfile
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+from xmlbackend import ET
+import alsfile
+from stream import StreamedSet
+from version import Version
+
+class StreamTestCase(unittest.TestCase):
+
+    file_test_version_1_A = "test_data/test_version_1_A.xml"
+    file_test_version_2_A = "test_data/test_version_2_A.xml"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assert_streams_like_parse(self, filename, parsed_filename):
+        streamed = StreamedSet(filename)
+        version = streamed.version()
+        parsed = Version(alsfile.parse(parsed_filename))
+        try:
+            self.assertEqual(streamed.summary, parsed.summary())
+            self.assertFalse(any(t.is_loaded() for t in version.tracks))
+            self.assertEqual(
+                [(t.track_id, t.type, t.return_map) for t in version.tracks],
+                [(t.track_id, t.type, t.return_map) for t in parsed.tracks]
+            )
+            for streamed_track, parsed_track in zip(version.tracks, parsed.tracks):
+                self.assertEqual(ET.tostring(streamed_track.elem), ET.tostring(parsed_track.elem))
+        finally:
+            version.close()
+
+    def test_streamed_set_matches_parsed_set(self):
+        self.assert_streams_like_parse(self.file_test_version_1_A, self.file_test_version_1_A)
+
+    def test_streamed_gzipped_set_matches_parsed_set(self):
+        path = os.path.join(self.temp_dir, 'set.als')
+        with open(self.file_test_version_1_A, 'rb') as f_in, gzip.open(path, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        self.assert_streams_like_parse(path, self.file_test_version_1_A)
+
+    def test_set_with_tracks_out_of_place_matches_parsed_set(self):
+        path = os.path.join(self.temp_dir, 'commented.xml')
+        with open(self.file_test_version_1_A, 'rb') as f:
+            data = f.read()
+        second = data.find(b'<MidiTrack', data.find(b'</MidiTrack>'))
+        with open(path, 'wb') as f:
+            f.write(data[:second] + b'<!-- moved -->' + data[second:])
+        self.assert_streams_like_parse(path, self.file_test_version_1_A)
+
+    def test_merge_only_reads_tracks_it_uses(self):
+        base = Version(alsfile.parse(self.file_test_version_1_A))
+        ours = StreamedSet(self.file_test_version_1_A).version()
+        theirs = StreamedSet(self.file_test_version_2_A).version()
+        try:
+            base.merge_with(ours, theirs)
+            # Nothing changed in ours
+            self.assertFalse(any(t.is_loaded() for t in ours.tracks))
+            self.assertTrue(any(t.is_loaded() for t in theirs.tracks))
+        finally:
+            ours.close()
+            theirs.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import shutil
+import tempfile
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+sys.path.append(os.path.join(CODE_DIR, 'benchmarks'))
+
+import alsfile
+import merge
+import synthetic
+
+class SyntheticSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_synthetic_sets_merge_with_changes_from_both_branches(self):
+        size = synthetic.SetSize(midi=4, audio=1, returns=2, devices=1, clips=2)
+        changes = synthetic.BranchChanges(changed=1, both_changed=1, added=1)
+        base, ours, theirs = synthetic.write_triple(self.temp_dir, size, changes)
+
+        merge.run([base, ours, theirs, ours])
+
+        tracks = list(alsfile.parse(ours).find('LiveSet').find('Tracks'))
+        self.assertEqual(len(tracks), 4 + 1 + 2 + 2)
+        self.assertEqual(len({t.attrib['Id'] for t in tracks}), len(tracks))
+        # The track changed in both, the middle MIDI track, has
+        # the device from ours and the clips from theirs
+        both = [t for t in tracks if t.attrib['Id'] == '3'][0]
+        devices = both.find('DeviceChain').find('DeviceChain').find('Devices')
+        self.assertEqual(len(devices), 1 + size.devices + 1)
+        self.assertEqual(
+            [c.attrib['Time'] for c in both.iter('MidiClip')],
+            [str(synthetic.CLIP_SPACING * i + synthetic.CLIP_SPACING // 2) for i in range(size.clips)]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import json
+import shutil
+import tempfile
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+from xmlbackend import ET
+import merge
+import tracing
+
+class TracingTestCase(unittest.TestCase):
+
+    file_test_version_1_A = "test_data/test_version_1_A.xml"
+    file_test_version_2_A = "test_data/test_version_2_A.xml"
+    file_test_version_2_B = "test_data/test_version_2_B.xml"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.trace_file = os.path.join(self.temp_dir, 'trace.jsonl')
+
+    def tearDown(self):
+        tracing.current = None
+        shutil.rmtree(self.temp_dir)
+
+    def test_phases_are_not_recorded_when_off(self):
+        tracing.start(None)
+        with tracing.phase('load'):
+            pass
+        self.assertIsNone(tracing.current)
+
+    def test_nested_phases_are_recorded(self):
+        tree = ET.fromstring(b'<A><B /><B /></A>')
+        trace = tracing.start(self.trace_file)
+        with tracing.phase('merge'):
+            with tracing.phase('apply', tree):
+                pass
+        self.assertEqual(
+            [(p['name'], p['depth'], p.get('nodes')) for p in trace.phases],
+            [('merge', 0, None), ('apply', 1, 3)]
+        )
+
+    def test_run_appends_a_trace_of_each_merge(self):
+        output = os.path.join(self.temp_dir, 'out.xml')
+        args = [self.file_test_version_1_A, self.file_test_version_2_A, self.file_test_version_2_B, output]
+        merge.run(args + ['--trace-file', self.trace_file])
+        merge.run(args + ['--trace-file', self.trace_file])
+
+        with open(self.trace_file) as f:
+            traces = [json.loads(line) for line in f]
+        self.assertEqual(len(traces), 2)
+        names = [p['name'] for p in traces[0]['phases']]
+        self.assertEqual(names[:3], ['fast_path', 'load', 'merge'])
+        self.assertEqual(names[-1], 'write')
+        self.assertIn('generate_sends', names)
+        self.assertTrue(all(p['seconds'] >= 0 for p in traces[0]['phases']))
+
+    def test_trace_does_not_take_the_next_argument(self):
+        output = os.path.join(self.temp_dir, 'out.xml')
+        args = [os.path.abspath(f) for f in (self.file_test_version_1_A, self.file_test_version_2_A, self.file_test_version_2_B)]
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        try:
+            merge.run(['--trace'] + args + [output])
+        finally:
+            os.chdir(cwd)
+
+        self.assertTrue(os.path.exists(output))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, tracing.TRACE_FILE)))
+
+
+if __name__ == '__main__':
+    unittest.main()
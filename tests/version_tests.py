@@ -1,10 +1,10 @@
 import unittest
-import xml.etree.ElementTree as ET
 import os, sys
 # Add the directory above this file to the path
 CODE_DIR = os.path.dirname(__file__)+"/.."
 sys.path.append(CODE_DIR)
 
+from xmlbackend import ET
 from version import Version
 
 class VersionTestCase(unittest.TestCase):
@@ -14,7 +14,7 @@ class VersionTestCase(unittest.TestCase):
     file_test_version_2_B = "test_data/test_version_2_B.xml"
 
     def load_xml_string_from_file(self, filename):
-        with open(filename, 'r') as f:
+        with open(filename, 'rb') as f:
             file_string = f.read()
             return file_string
 
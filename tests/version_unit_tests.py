@@ -1,11 +1,12 @@
 import unittest
-import xml.etree.ElementTree as ET
 import os, sys
+from unittest import mock
 # Add the directory above this file to the path
 CODE_DIR = os.path.dirname(__file__)+"/.."
 sys.path.append(CODE_DIR)
 
-from version import Version, Track, TrackType
+from xmlbackend import ET
+from version import Version, TrackType, COLLIDABLE_TAG
 
 class VersionUnitTestCase(unittest.TestCase):
 
@@ -19,7 +20,7 @@ class VersionUnitTestCase(unittest.TestCase):
         self.version_2 = Version(ET.fromstring(version_2_string))
 
     def load_xml_string_from_file(self, filename):
-        with open(filename, 'r') as f:
+        with open(filename, 'rb') as f:
             file_string = f.read()
             return file_string
     
@@ -33,6 +34,25 @@ class VersionUnitTestCase(unittest.TestCase):
         self.assertTrue(len(track_list) == 10)
         self.assertTrue(len(list(tracks_et)) == 10)
 
+    def test_track_index_follows_track_changes(self):
+        """
+        Test that tracks can be looked up by id after
+        adding, replacing and removing tracks
+        """
+        new_track = self.version_2.tracks[0]
+        replacement = self.version_2.get_track_with_id(12)
+        removed = self.version_1.get_track_with_id(13)
+
+        self.version_1.add_track(new_track)
+        self.version_1.replace_track(replacement)
+        self.version_1.remove_tracks([removed])
+
+        self.assertIs(self.version_1.get_track_with_id(new_track.track_id), new_track)
+        self.assertIs(self.version_1.get_track_with_id(12), replacement)
+        self.assertIsNone(self.version_1.get_track_with_id(13))
+        self.assertEqual(set(self.version_1.track_ids()), {t.track_id for t in self.version_1.tracks})
+        self.assertEqual(len(list(self.version_1.tree.find('LiveSet').find('Tracks'))), len(self.version_1.tracks))
+
     def test_reconcile_send_values(self):
         """
         Test that final mapping of return to send values is
@@ -62,6 +82,21 @@ class VersionUnitTestCase(unittest.TestCase):
         self.assertTrue(self.version_1.tracks[-1].type == TrackType.RETURN)
         self.assertTrue(self.version_1.tracks[-2].type == TrackType.RETURN)
         self.assertTrue(self.version_1.tracks[-3].type == TrackType.RETURN)
+
+    def test_track_changes_keep_tracks_element_in_order(self):
+        """
+        Test that the Tracks element follows the tracks through
+        removals, replacements, additions and reordering
+        """
+        version = self.version_1
+        version.remove_tracks([version.tracks[0], version.tracks[3]])
+        version.replace_tracks([self.version_2.get_track_with_id(version.tracks[1].track_id)])
+        version.add_track(self.version_2.tracks[0])
+        version.move_return_tracks_to_end()
+
+        self.assertEqual(list(version.tracks_elem), [t.elem for t in version.tracks])
+        types = [t.type for t in version.tracks]
+        self.assertEqual(types, sorted(types, key=lambda t: t == TrackType.RETURN))
         
 
     def test_amend_sends_pre(self):
@@ -81,7 +116,43 @@ class VersionUnitTestCase(unittest.TestCase):
         are made unique by generating a new value for
         each of the collisions
         """
+        tracks = self.version_1.tracks
+        automation_targets = [
+            t.elem.find('DeviceChain').find('Mixer').find('Volume').find('AutomationTarget')
+                for t in tracks[:2]
+        ]
+        automation_targets[1].attrib['Id'] = automation_targets[0].attrib['Id']
+
+        self.version_1.amend_global_id_collisions()
+        self.assertNotEqual(automation_targets[0].attrib['Id'], automation_targets[1].attrib['Id'])
+
+        seen = set()
+        for node in self.version_1.tree.iter():
+            if node.tag in COLLIDABLE_TAG:
+                self.assertNotIn(node.attrib['Id'], seen)
+                seen.add(node.attrib['Id'])
+
+    def test_amend_global_id_collisions_only_renumbers_merged_tracks(self):
+        """
+        Test that once tracks have been merged in, only the ids
+        of the merged tracks are changed to resolve collisions
+        """
+        def collidable_nodes(elem):
+            return [n for n in elem.iter() if n.tag in COLLIDABLE_TAG]
+
+        base_nodes = collidable_nodes(self.version_1.tree)
+        base_ids = [n.attrib['Id'] for n in base_nodes]
+        new_track = self.version_2.get_track_with_id(12)
+        new_ids = {n.attrib['Id'] for n in collidable_nodes(new_track.elem)}
+        self.assertTrue(new_ids & set(base_ids))
 
+        self.version_1.add_track(new_track)
+        self.version_1.amend_global_id_collisions()
+
+        self.assertEqual([n.attrib['Id'] for n in base_nodes], base_ids)
+        new_ids = {n.attrib['Id'] for n in collidable_nodes(new_track.elem)}
+        self.assertFalse(new_ids & set(base_ids))
+        self.assertEqual(self.version_1.pending_ids, [])
 
     def amend_track_collisions(self):
         """
@@ -113,5 +184,75 @@ class VersionUnitTestCase(unittest.TestCase):
             sends = t.elem.find('DeviceChain').find('Mixer').find('Sends')
             self.assertTrue(len(list(sends)) == 3)
 
+    def test_generate_sends_keeps_unchanged_sends(self):
+        """
+        Test that regenerating sends only replaces the
+        send holders whose value changed
+        """
+        self.version_1.reconcile_send_values()
+        self.version_1.generate_sends()
+        track = self.version_1.tracks[0]
+        before = list(track.node('Sends'))
+
+        track.final_ordered_mapping[1] = 0.5
+        self.version_1.generate_sends()
+        after = list(track.node('Sends'))
+        self.assertIs(after[0], before[0])
+        self.assertIsNot(after[1], before[1])
+        self.assertEqual(after[1].find('Send').find('Manual').attrib['Value'], '0.5')
+        self.assertEqual([s.attrib['Id'] for s in after], ['0', '1', '2'])
+
+    def test_track_node_index(self):
+        """
+        Test that indexed track nodes match the tree, that missing
+        ones are remembered, and that they are found again after
+        the track changes
+        """
+        track = self.version_1.tracks[0]
+        sends = track.elem.find('DeviceChain').find('Mixer').find('Sends')
+        self.assertIs(track.node('Sends'), sends)
+
+        track.elem.find('DeviceChain').remove(track.elem.find('DeviceChain').find('Mixer'))
+        self.assertIs(track.node('Sends'), sends)
+        track.invalidate()
+        self.assertIsNone(track.node('Sends'))
+        self.assertIn('Sends', track._nodes)
+
+    def test_track_send_holder_index(self):
+        """
+        Test that the send holders of a track are indexed once, for
+        comparing tracks too, and again after the track changes
+        """
+        track = self.version_1.tracks[0]
+        sends = track.node('Sends')
+        self.assertEqual(track.send_holders(), {sends: {h.attrib['Id']: h for h in sends}})
+
+        other = Version(ET.fromstring(self.load_xml_string_from_file(self.file_test_version_1_A)))
+        for t in other.tracks:
+            t.send_holders()
+        for t in self.version_1.tracks:
+            t.send_holders()
+        with mock.patch('equal.index_children', side_effect=AssertionError):
+            self.assertTrue(self.version_1.version_semantically_equal_to(other))
+
+        sends.remove(sends[0])
+        track.invalidate()
+        self.assertEqual(list(track.send_holders()[sends]), [h.attrib['Id'] for h in sends])
+
+    def test_conflict_with_holds_differences(self):
+        """
+        Test that a Conflict holds where each branch differs from base
+        """
+        theirs = Version(ET.fromstring(self.load_xml_string_from_file(self.file_test_version_1_A)))
+        devices = theirs.get_track_with_id(12).elem.find('DeviceChain').find('DeviceChain').find('Devices')
+        devices.append(ET.Element('AudioEffectGroupDevice'))
+
+        conflict = self.version_1.conflict_with(12, self.version_1, theirs)
+        self.assertEqual(conflict.differences['ours'], [])
+        self.assertEqual(
+            conflict.differences['theirs'],
+            [('MidiTrack/DeviceChain[1]/DeviceChain[1]/Devices[1]', 'len', len(devices) - 1, len(devices))]
+        )
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,63 @@
+import unittest
+import json
+import shutil
+import tempfile
+import threading
+import time
+import os, sys
+from unittest import mock
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+import wait
+
+class WaitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.done_file = os.path.join(self.temp_dir, 'done')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_later(self, delay, contents):
+        def write():
+            time.sleep(delay)
+            with open(self.done_file, 'w') as f:
+                f.write(contents)
+        thread = threading.Thread(target=write)
+        thread.start()
+        return thread
+
+    def test_returns_when_file_is_written(self):
+        thread = self.write_later(0.1, '{}')
+        start = time.monotonic()
+        self.assertTrue(wait.wait_for_file(self.done_file, timeout=5))
+        self.assertLess(time.monotonic() - start, 1)
+        thread.join()
+
+    def test_returns_false_on_timeout(self):
+        self.assertFalse(wait.wait_for_file(self.done_file, timeout=0.1))
+
+    def test_wait_for_json_loads_resolution(self):
+        thread = self.write_later(0.1, json.dumps({'conf_0.als': True}))
+        self.assertEqual(wait.wait_for_json(self.done_file, timeout=5), {'conf_0.als': True})
+        thread.join()
+
+    def test_wait_for_json_raises_on_timeout(self):
+        with self.assertRaises(wait.ResolutionTimeout):
+            wait.wait_for_json(self.done_file, timeout=0.1)
+
+    def test_wait_for_json_raises_once_invalid_file_settles(self):
+        with open(self.done_file, 'w') as f:
+            f.write('{"conf_0.als": ')
+        start = time.monotonic()
+        with mock.patch('wait.SETTLE_TIME', 0.2):
+            with self.assertRaises(wait.ResolutionTimeout):
+                wait.wait_for_json(self.done_file)
+        self.assertLess(time.monotonic() - start, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import os, sys
+# Add the directory above this file to the path
+CODE_DIR = os.path.dirname(__file__)+"/.."
+sys.path.append(CODE_DIR)
+
+import xmlbackend
+from xmlbackend import ET
+
+class XmlBackendTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = xmlbackend.fromstring(b'<A Id="1"><B Id="2"><A Id="3" /></B><C /></A>')
+
+    def test_iter_tags_is_in_document_order(self):
+        self.assertEqual([e.attrib['Id'] for e in xmlbackend.iter_tags(self.root, {'A', 'B'})], ['1', '2', '3'])
+
+    def test_shallow_copy_leaves_original_alone(self):
+        copied = xmlbackend.shallow_copy(self.root)
+        copied.attrib['Id'] = '4'
+        del copied[0]
+        self.assertEqual(self.root.attrib['Id'], '1')
+        self.assertEqual([e.tag for e in self.root], ['B', 'C'])
+        self.assertEqual([e.tag for e in copied], ['C'])
+
+    def test_attachable_leaves_original_tree_alone(self):
+        other = ET.Element('D')
+        other.append(xmlbackend.attachable(self.root[0]))
+        self.assertEqual([e.tag for e in self.root], ['B', 'C'])
+        self.assertEqual([e.tag for e in other], ['B'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Optional record of where a merge spends its time and memory.
+
+Turned on with merge.py --trace or --trace-file, or by setting
+ALS_MERGE_TRACE to the file to write to ('1' for TRACE_FILE). Each merge appends one JSON
+line to the file, with the wall time, peak RSS and number of elements
+in the base set after each phase. When off, phase() does nothing
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows
+    resource = None
+
+TRACE_ENV = 'ALS_MERGE_TRACE'
+TRACE_FILE = '.merge/trace.jsonl'
+
+# The Trace being recorded, if any
+current = None
+
+
+class Trace():
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.phases = []
+        self.depth = 0
+        self.start = time.perf_counter()
+        # Time spent counting nodes, left out of the phases
+        self.overhead = 0.0
+
+    @contextmanager
+    def phase(self, name, tree=None):
+        record = {'name': name, 'depth': self.depth}
+        self.phases.append(record)
+        self.depth += 1
+        overhead = self.overhead
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            record['seconds'] = end - start - (self.overhead - overhead)
+            record['peak_rss'] = peak_rss()
+            if tree is not None:
+                record['nodes'] = sum(1 for _ in tree.iter())
+                self.overhead += time.perf_counter() - end
+            self.depth -= 1
+
+    def summary(self, **info):
+        summary = {
+            'time': time.time(),
+            'argv': sys.argv,
+            'seconds': time.perf_counter() - self.start,
+            'overhead': self.overhead,
+            'peak_rss': peak_rss(),
+            'phases': self.phases,
+        }
+        summary.update(info)
+        return summary
+
+    def write(self, **info):
+        folder = os.path.dirname(self.filename)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(self.summary(**info)) + '\n')
+
+
+def start(filename=None):
+    """
+    Starts recording to filename, or to the file named by
+    ALS_MERGE_TRACE if not given. Returns the Trace, or None
+    if neither was given
+    """
+    global current
+    if filename is None:
+        filename = os.environ.get(TRACE_ENV)
+        if filename == '1':
+            filename = TRACE_FILE
+    current = Trace(filename) if filename else None
+    return current
+
+
+def stop(**info):
+    """
+    Writes the current trace, with info added to it, and stops recording
+    """
+    global current
+    if current is not None:
+        current.write(**info)
+    current = None
+
+
+@contextmanager
+def phase(name, tree=None):
+    """
+    Records the time taken by the body under name, and the number
+    of elements in tree afterwards if given
+    """
+    if current is None:
+        yield
+    else:
+        with current.phase(name, tree):
+            yield
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process so far in bytes, or None
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 
-import xml.etree.ElementTree as ET
+from xmlbackend import ET
 from enum import Enum
-from equal import tree_equal
-from conflict import Conflict
+from equal import tree_equal, fingerprint, fingerprint_equal, diff, index_children
+import merkle
+import ids
+import sends
+import wait
+import tracing
+import alsfile
 import os
-import webbrowser 
-import gzip
-import json
+import copy
+from collections import namedtuple
 
 TRACK_SEND_HOLDER = """
         <TrackSendHolder Id="0">
@@ -29,6 +33,26 @@ TRACK_SEND_HOLDER = """
         </TrackSendHolder>
 """
 
+SEND_PRE_BOOL = """<SendPreBool Id="3" Value="false" />"""
+
+
+class ElementTemplate():
+    """
+    An element parsed once from its XML, of which
+    copies can then be made without parsing again
+    """
+
+    def __init__(self, xml):
+        self.elem = ET.fromstring(xml.strip())
+
+    def make(self, **attrib):
+        elem = copy.deepcopy(self.elem)
+        elem.attrib.update(attrib)
+        return elem
+
+TRACK_SEND_HOLDER_TEMPLATE = ElementTemplate(TRACK_SEND_HOLDER)
+SEND_PRE_BOOL_TEMPLATE = ElementTemplate(SEND_PRE_BOOL)
+
 
 COLLIDABLE_TAG = [
         "AutomationTarget",
@@ -39,27 +63,77 @@ COLLIDABLE_TAG = [
         "FluxModulationTarget",
         "SampleOffsetModulationTarget"
 ]
+COLLIDABLE_TAGS = frozenset(COLLIDABLE_TAG)
+
+# The parts of a Track that can be computed away from the main
+# process or cached between merges (see loader.py) and handed back cheaply
+TrackSummary = namedtuple('TrackSummary', ['track_id', 'preliminary_return_map', 'fingerprint'])
+
+# The same for a Version, ids being the counts of its collidable ids.
+# layout is where the tracks are in the set's XML, for a set read
+# through by a StreamedSet (see StreamedSet.layout), otherwise None
+VersionSummary = namedtuple('VersionSummary', ['tracks', 'ids', 'layout'], defaults=[None])
+
+# Part of the keys of cached summaries. Increase it whenever the
+# summaries or how their fingerprints are computed change, so that
+# those cached before are not used
+SUMMARY_FORMAT = 2
 
 class Version():
     
-    def __init__(self, tree):
+    # tracks, if given, are used instead of those in tree, as for
+    # a set that is only read from (see stream.py). source is then
+    # what they are read from, released by close()
+    def __init__(self, tree, summary=None, tracks=None, source=None):
 
         # The ElementTree for the whole version
         self.tree = tree
+        self.source = source
 
-        # All tracks in this version
-        self.tracks = [Track(elem) for elem in list(tree.find('LiveSet').find('Tracks'))]
+        # The Tracks element, whose children are kept in the
+        # same order as self.tracks
+        self.tracks_elem = tree.find('LiveSet').find('Tracks')
 
-        ordered_return_tracks = [t for t in self.tracks if t.type == TrackType.RETURN]
-        # Set a mapping from track object to value in each track,
-        # rather than the return track index
-        num_tracks = len(ordered_return_tracks)
-        for track in self.tracks:
-            mapping = {}
-            for index in track.preliminary_return_map:
-                value = track.preliminary_return_map[index]
-                mapping[ordered_return_tracks[index].track_id] = value    
-            track.set_return_map(mapping)
+        # All tracks in this version
+        track_elems = list(self.tracks_elem)
+        if tracks is not None:
+            self.tracks = tracks
+        elif summary is None:
+            self.tracks = [Track(elem) for elem in track_elems]
+        else:
+            self.tracks = [Track(elem, s) for elem, s in zip(track_elems, summary.tracks)]
+
+        # Track id to the tracks with that id, in the order they were
+        # added. Kept up to date by add_track, replace_tracks and
+        # remove_tracks, there is normally only one track per id
+        self.reindex_tracks()
+
+        # Count of every collidable id in the tree, see ensure_id_index
+        self.id_index = None
+        if summary is not None:
+            self.id_index = ids.IdAllocator.from_counts(summary.ids)
+        # (track, element) pairs merged into the tree whose ids have
+        # not been checked against id_index yet
+        self.pending_ids = []
+
+        # The send levels of every track by return track id rather
+        # than position, as read. Each track's return_map is its row
+        return_ids = [t.track_id for t in self.tracks if t.type == TrackType.RETURN]
+        self.sends = sends.SendMatrix.from_positions(
+            return_ids, [t.preliminary_return_map for t in self.tracks]
+        )
+        for track, row in zip(self.tracks, self.sends.rows()):
+            track.set_return_map(row)
+
+    def close(self):
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+    # Must be taken before anything is merged into this version
+    def summary(self):
+        self.ensure_id_index()
+        return VersionSummary([t.summary() for t in self.tracks], dict(self.id_index.used))
 
     def get_return_tracks(self):
         return_tracks = []
@@ -69,32 +143,61 @@ class Version():
         return return_tracks
 
     def get_track_with_id(self, id_):
+        tracks = self.tracks_by_id.get(id_)
+        if tracks:
+            return tracks[0]
+
+    # Set-like view of the ids of all tracks in this version
+    def track_ids(self):
+        return self.tracks_by_id.keys()
+
+    def reindex_tracks(self):
+        self.tracks_by_id = {}
         for track in self.tracks:
-            if track.track_id == id_:
-                return track
+            self.tracks_by_id.setdefault(track.track_id, []).append(track)
 
-    def merge_with(self, ours, theirs):
+    # Mapping of the position of each return track in this version
+    # to its position in other, for the return tracks in both
+    # See note in equal.py for why this is necessary
+    def send_map_to(self, other):
+        # Their send id is based on their ordering 
+        # The key will be the send ID in this version
+        # The value will be that send's ID in the other version
+        other_r_locs = {}
+        for loc, t in enumerate(other.get_return_tracks()):
+            other_r_locs.setdefault(t.track_id, loc)
+        send_map = {}
+        self_r_seen = set()
+        for loc, t in enumerate(self.get_return_tracks()):
+            if t.track_id in other_r_locs and t.track_id not in self_r_seen:
+                send_map[loc] = other_r_locs[t.track_id]
+            self_r_seen.add(t.track_id)
+        return send_map
+
+    # resolve_timeout is how many seconds to wait for conflicts to be
+    # resolved before raising wait.ResolutionTimeout, None to wait forever
+    def merge_with(self, ours, theirs, resolve_timeout=None):
 
-        our_added = ours.get_added_tracks_compared_to(self)
-        their_added = theirs.get_added_tracks_compared_to(self)
+        with tracing.phase('ensure_id_index', self.tree):
+            self.ensure_id_index()
 
-        our_removed = ours.get_removed_tracks_compared_to(self)
-        their_removed = theirs.get_removed_tracks_compared_to(self)
+        with tracing.phase('added_removed', self.tree):
+            our_added = ours.get_added_tracks_compared_to(self)
+            their_added = theirs.get_added_tracks_compared_to(self)
+
+            our_removed = ours.get_removed_tracks_compared_to(self)
+            their_removed = theirs.get_removed_tracks_compared_to(self)
 
        
-        # Any removed from both
-        our_removed_ids = [t.track_id for t in our_removed]
-        their_removed_ids = [t.track_id for t in their_removed]
-        both_removed_ids = [t for t in our_removed_ids if t in their_removed_ids]
+            # Any removed from both
+            our_removed_ids = {t.track_id for t in our_removed}
+            their_removed_ids = {t.track_id for t in their_removed}
+            both_removed_ids = our_removed_ids & their_removed_ids
         
-        # Remove the tracks from self
-        both_removed = [t for t in self.tracks if t.track_id in both_removed_ids]
-        self.tracks = [t for t in self.tracks if t.track_id not in both_removed_ids]   
-         
-        for t in both_removed:
+            # Remove the tracks from self
             # NOTE: This might not work if merging multiple times as the elements
             # will have changed after reconcilliation
-            self.tree.find('LiveSet').find('Tracks').remove(t.elem)
+            self.remove_tracks([t for t in self.tracks if t.track_id in both_removed_ids])
 
 
         # Get all of the return value mappings for each track in each version
@@ -102,63 +205,59 @@ class Version():
         # As can removed
         # Only care about maintained?
         # We have track.return_map at this point for ours and theirs
-        our_same = ours.get_intersection_tracks_compared_to(self)
-        their_same = theirs.get_intersection_tracks_compared_to(self)
+        with tracing.phase('updated', self.tree):
+            our_same = ours.get_intersection_tracks_compared_to(self)
+            their_same = theirs.get_intersection_tracks_compared_to(self)
 
         
-        def get_updated_tracks(branch, branch_same_tracks, base):
-            base_tracks = base.tracks
-            updated_tracks = []
-            for track in branch_same_tracks:
-                original_track = [t for t in base_tracks if t.track_id == track.track_id][0]
+            def get_updated_tracks(branch, branch_same_tracks, base):
+                updated_tracks = []
                 # Create mapping of returns
-                # See note in equal.py for why this is necessary
-                branch_return = branch.get_return_tracks()
-                base_return = base.get_return_tracks()
-                return_intersection_ids = [t.track_id for t in branch_return if t.track_id in [b.track_id for b in base_return]]
-                # Get send ID mapping of these tracks to eachother
-                # Their send id is based on their ordering 
-                # The key will be the base send ID
-                # The value will be that send's ID in the branch track
-                send_map = {}
-                branch_r_ids = [t.track_id for t in branch_return]
-                base_r_ids = [t.track_id for t in base_return]
-                for i in return_intersection_ids:
-                    br_loc = branch_r_ids.index(i)
-                    ba_loc = base_r_ids.index(i)
-                    send_map[ba_loc] = br_loc
-
-                if not tree_equal(track.elem, original_track.elem, send_map):
-                    updated_tracks.append(track)
-                else:
-                    pass
-            return updated_tracks 
-
-
-        # Can guarantee only one track in array
-        updated_in_ours = get_updated_tracks(ours, our_same, self)
-        updated_in_theirs = get_updated_tracks(theirs, their_same, self)
-
-        # Intersection of both of these
-        conflicting_track_ids = [t.track_id for t in updated_in_ours if t.track_id in [h.track_id for h in updated_in_theirs]]
-        conflicts = [Conflict(*map(lambda x: ET.tostring(x.get_track_with_id(id_).elem).decode() , [self, ours, theirs])) for id_ in conflicting_track_ids] 
-
-        updates = [t for t in updated_in_ours if t.track_id not in conflicting_track_ids]
-        updates += [t for t in updated_in_theirs if t.track_id not in conflicting_track_ids]
+                send_map = base.send_map_to(branch)
+                for track in branch_same_tracks:
+                    original_track = base.get_track_with_id(track.track_id)
+                    if not fingerprint_equal(track.fingerprint, original_track.fingerprint, send_map):
+                        updated_tracks.append(track)
+                    else:
+                        pass
+                return updated_tracks 
+
+
+            # Can guarantee only one track in array
+            updated_in_ours = get_updated_tracks(ours, our_same, self)
+            updated_in_theirs = get_updated_tracks(theirs, their_same, self)
+
+            # Intersection of both of these
+            updated_in_theirs_ids = {t.track_id for t in updated_in_theirs}
+            both_updated_ids = [t.track_id for t in updated_in_ours if t.track_id in updated_in_theirs_ids]
+
+        with tracing.phase('merge_tracks', self.tree):
+            # Tracks changed in both branches only conflict if the
+            # same parts of the track were changed
+            conflicting_track_ids = [
+                id_ for id_ in both_updated_ids
+                    if not self.merge_track(
+                        ours.get_track_with_id(id_), theirs.get_track_with_id(id_)
+                    )
+            ]
+            conflicts = [self.conflict_with(id_, ours, theirs) for id_ in conflicting_track_ids]
+
+        with tracing.phase('apply', self.tree):
+            updates = [t for t in updated_in_ours if t.track_id not in updated_in_theirs_ids]
+            updates += [t for t in updated_in_theirs if t.track_id not in both_updated_ids]
                     
-        for track in updates:
-            self.replace_track(track)
+            self.replace_tracks(updates)
 
-        # Can safely add the tracks now
-        for track in our_added:
-            self.add_track(track)
+            # Can safely add the tracks now
+            for track in our_added:
+                self.add_track(track)
 
-        for track in their_added:
-            self.add_track(track)
+            for track in their_added:
+                self.add_track(track)
 
         
-        ours.reconcile_send_values()
-        theirs.reconcile_send_values()
+            ours.reconcile_send_values()
+            theirs.reconcile_send_values()
         # Await conflicts here
         # need to make barebones files
         # notify macOS app using webbrowser
@@ -167,81 +266,45 @@ class Version():
         # if it's a return track, get a track as well that uses
         # it
         if len(conflicts) > 0:
-            conflict_files = []
-            for i, conf in enumerate(conflicts):
-                # Create a new project from blank.xml to hold the sample project for viewing the conflicts
-                sample_root = ET.parse('.merge/blank.xml').getroot()
-
-                # Remove any residual tracks from the blank file's tracks
-                sample_tracks = sample_root.find('LiveSet').find('Tracks')
-                for c in list(sample_tracks):
-                    sample_tracks.remove(c)
-
-                # Add our branch to sample
-                sample_ours = ET.fromstring(conf.ours)
-                sample_ours.attrib['Id'] = "10"
-                sample_ours.find('Name').find('UserName').attrib['Value'] = 'Ours'
-
-                # Add their branch to sample
-                sample_theirs = ET.fromstring(conf.theirs)
-                sample_theirs.attrib['Id'] = "20"
-                sample_theirs.find('Name').find('UserName').attrib['Value'] = 'Theirs'
-
-                # Remove send values
-                sample_ours_sends = sample_ours.find('DeviceChain').find('Mixer').find('Sends')
-                sample_theirs_sends = sample_theirs.find('DeviceChain').find('Mixer').find('Sends')
-                for c in list(sample_ours_sends):
-                    sample_ours_sends.remove(c)
-                for c in list(sample_theirs_sends):
-                    sample_theirs_sends.remove(c)
-
-                # Add our tracks to the sample
-                sample_tracks.append(sample_ours)
-                sample_tracks.append(sample_theirs)
-                sample_tree = ET.ElementTree(sample_root)
-
-                # Create a temporary folder to hold the samples
-                temp_folder_name = '.conftemp'
-                if not os.path.exists(temp_folder_name):
-                    os.makedirs(temp_folder_name)
-
-                # Create the sample file path
-                filename = 'conf_' + str(i) + '.xml'
-                full_path = temp_folder_name + '/' + filename
-                full_als_path = temp_folder_name + '/' + 'conf_' + str(i) + '.als'
-
-                # Write the samples to the folder
-                sample_tree.write(full_path, encoding='utf-8', xml_declaration=True)
-                with open(full_path, 'rb') as f_in, gzip.open(full_als_path, 'wb') as f_out:
-                    f_out.writelines(f_in)
-
-                # Add the file path to the list of sample file paths
-                conflict_files.append(full_als_path)
-
-            # Make a call to the url scheme for the jackdaw app
-            # appending the paths of the sample files
-            url_scheme = 'jackdaw://merge/'
-            for cpath in conflict_files:
-                url_scheme += cpath + '+'
-            url_scheme = url_scheme[:-1]
-            webbrowser.open(url_scheme)
-
-            # Wait until the resolution file is present
-            # created by the jackdaw app
-            import time
-            done_file = '.merge/done'
-            while not os.path.exists(done_file):
-                time.sleep(1)
-
-            resolutions = []
-
-            # Eventually make this so that it reloads from
-            # the actual als file so that user edits are saved
-
-            # Open the resolution file
-            with open(done_file) as json_data:
-                # Load the contents of the file into json
-                conf_branch_map = json.load(json_data)
+            with tracing.phase('resolve_conflicts', self.tree):
+                # Only needed for conflicts, which most merges have none of
+                import shutil
+                import webbrowser
+                from conflict import PreviewBuilder
+
+                # Create the sample projects for viewing the conflicts
+                # in a temporary folder
+                conflict_files = PreviewBuilder().write_all(conflicts, '.conftemp')
+
+                # Make a call to the url scheme for the jackdaw app
+                # appending the paths of the sample files
+                url_scheme = 'jackdaw://merge/'
+                for cpath in conflict_files:
+                    url_scheme += cpath + '+'
+                url_scheme = url_scheme[:-1]
+
+                # A resolution left by an earlier merge, or one written
+                # after it gave up, would be taken for this one's
+                done_file = '.merge/done'
+                remove_if_exists(done_file)
+                webbrowser.open(url_scheme)
+
+                # Wait until the resolution file is present
+                # created by the jackdaw app
+                try:
+                    # Load the contents of the file into json
+                    conf_branch_map = wait.wait_for_json(done_file, resolve_timeout)
+                except (wait.ResolutionTimeout, KeyboardInterrupt):
+                    # Leave nothing behind so that the merge can be retried
+                    shutil.rmtree('.conftemp', ignore_errors=True)
+                    remove_if_exists(done_file)
+                    raise
+
+                resolutions = []
+
+                # Eventually make this so that it reloads from
+                # the actual als file so that user edits are saved
+
                 for conf, branch in conf_branch_map.items():
                     # For each path: true/false ours/theirs
                     # Get the index of the resolution from the original list of files
@@ -254,18 +317,18 @@ class Version():
                         resolutions.append(theirs)
              
 
-            for i, track_id in enumerate(conflicting_track_ids):
-                # Get the chosen version
-                chosen_branch = resolutions[i]
-                # Get the track from the chosen branch with the selected ID
-                to_replace_with = chosen_branch.get_track_with_id(track_id)
-                # Replace the track with that ID
-                self.replace_track(to_replace_with)
+                chosen_tracks = []
+                for i, track_id in enumerate(conflicting_track_ids):
+                    # Get the chosen version
+                    chosen_branch = resolutions[i]
+                    # Get the track from the chosen branch with the selected ID
+                    chosen_tracks.append(chosen_branch.get_track_with_id(track_id))
+                # Replace the tracks with those IDs, all at once
+                self.replace_tracks(chosen_tracks)
                     
 
-            os.remove('.merge/done')
-            import shutil
-            shutil.rmtree('.conftemp')
+                os.remove(done_file)
+                shutil.rmtree('.conftemp')
 
                 
 
@@ -273,14 +336,20 @@ class Version():
 
 
         
-        self.move_return_tracks_to_end()
-        self.reconcile_send_values()
+        with tracing.phase('move_return_tracks_to_end', self.tree):
+            self.move_return_tracks_to_end()
+        with tracing.phase('reconcile_send_values', self.tree):
+            self.reconcile_send_values()
 
-        self.amend_track_collisions()
+        with tracing.phase('amend_track_collisions', self.tree):
+            self.amend_track_collisions()
 
-        self.generate_sends()
-        self.amend_global_id_collisions()
-        self.amend_sends_pre()
+        with tracing.phase('generate_sends', self.tree):
+            self.generate_sends()
+        with tracing.phase('amend_global_id_collisions', self.tree):
+            self.amend_global_id_collisions()
+        with tracing.phase('amend_sends_pre', self.tree):
+            self.amend_sends_pre()
 
 
 
@@ -288,8 +357,7 @@ class Version():
     # the version passed to the method 
     # Checks by the ID of the tracks
     def get_added_tracks_compared_to(self, version):
-        their_tracks = version.tracks
-        their_track_ids = [t.track_id for t in their_tracks]
+        their_track_ids = version.track_ids()
         return [t for t in self.tracks if t.track_id not in their_track_ids]
 
     # Inversion of added tracks - added tracks relative to provided version
@@ -297,27 +365,47 @@ class Version():
         return version.get_added_tracks_compared_to(self)
 
     def get_intersection_tracks_compared_to(self, version):
-        their_tracks = version.tracks
-        their_track_ids = [t.track_id for t in their_tracks]
+        their_track_ids = version.track_ids()
         return [t for t in self.tracks if t.track_id in their_track_ids]
 
     # Only use if you can guarantee that there is only one with the id
-    # of this track
+    # of this track
     def replace_track(self, track):
+        self.replace_tracks([track])
+
+    # Replaces all tracks sharing an id with each of the given tracks,
+    # which are added at the end in order
+    def replace_tracks(self, tracks):
         remove = []
-        for t in self.tracks:
-            if t.track_id == track.track_id:
-                remove.append(t)
-        for t in remove:
-            self.tracks.remove(t)
-            self.tree.find('LiveSet').find('Tracks').remove(t.elem)
-        self.add_track(track)
+        for track in tracks:
+            remove += self.tracks_by_id.get(track.track_id, [])
+        self.remove_tracks(remove)
+        for track in tracks:
+            self.add_track(track)
 
+    def remove_tracks(self, tracks):
+        if not tracks:
+            return
+        remove = set(tracks)
+        self.tracks[:] = [t for t in self.tracks if t not in remove]
+        removed_elems = set()
+        for t in tracks:
+            self.release_ids(t.elem)
+            removed_elems.add(id(t.elem))
+            same_id = self.tracks_by_id[t.track_id]
+            same_id.remove(t)
+            if not same_id:
+                del self.tracks_by_id[t.track_id]
+        # In one pass, rather than searching the children for each
+        self.tracks_elem[:] = [e for e in self.tracks_elem if id(e) not in removed_elems]
 
     def add_track(self, track):
 
+        self.ensure_id_index()
+        self.pending_ids.append((track, track.elem))
         self.tracks.append(track)
-        self.tree.find('LiveSet').find('Tracks').append(track.elem)
+        self.tracks_by_id.setdefault(track.track_id, []).append(track)
+        self.tracks_elem.append(track.elem)
 
     # take return values from the stored dictionary in each track and
     # make sure they are reflected in the xml
@@ -331,24 +419,14 @@ class Version():
     # Does not mutate ETree
     def reconcile_send_values(self):
         # Get all return tracks
-        return_tracks = [r for r in self.tracks if r.type == TrackType.RETURN]
+        return_ids = [r.track_id for r in self.tracks if r.type == TrackType.RETURN]
 
         # Put correct sends for each return track,
-        # adding them if they do not exist
+        # adding them with a level of 0 if they do not exist
         # in track.final_ordered_mapping
-        for track in self.tracks:
-            new_mapping = {}
-            for rt in return_tracks:
-                try:
-                    value = track.return_map[rt.track_id]
-                    new_mapping[rt.track_id] = value
-                except KeyError:
-                    # create a new entry with default
-                    new_mapping[rt.track_id] = 0
-            #track.return_map = new_mapping
-            track.final_ordered_mapping = [] 
-            for rt in return_tracks:
-                track.final_ordered_mapping.append(new_mapping[rt.track_id])
+        final = sends.gather([t.return_map for t in self.tracks], return_ids, default=0)
+        for track, mapping in zip(self.tracks, final):
+            track.final_ordered_mapping = mapping
 
 
     def move_return_tracks_to_end(self):
@@ -361,18 +439,18 @@ class Version():
                 tracks_copy.append(track)
         self.tracks = tracks_copy + return_tracks
 
-            
-        for track in return_tracks:
-            self.tree.find('LiveSet').find('Tracks').remove(track.elem)
-            self.tree.find('LiveSet').find('Tracks').append(track.elem)
+        # Reordered in one pass, the children being in
+        # the same order as the tracks
+        self.tracks_elem[:] = [track.elem for track in self.tracks]
 
 
 
     # Check and amend collisions in IDs before writing
     # Make sure return tracks all at end?
-    def write(self, filename):
+    def write(self, filename, compress=False):
         tree = ET.ElementTree(self.tree)
-        tree.write(filename, encoding='utf-8', xml_declaration=True)
+        with alsfile.open_for_writing(filename, compress) as f:
+            tree.write(f, encoding='utf-8', xml_declaration=True)
 
     def _dump(self, filename):
         tree = ET.ElementTree(self.tree)
@@ -381,118 +459,144 @@ class Version():
     def amend_sends_pre(self):
         return_tracks = [t for t in self.tracks if t.type == TrackType.RETURN]
         return_tracks_count = len(return_tracks)
-        sp_str = """<SendPreBool Id="3" Value="false" />"""
         sp = self.tree.find('LiveSet').find('SendsPre')
         curr_count = len(list(sp))
         for i in range(curr_count, return_tracks_count):
-            elem = ET.fromstring(sp_str)
-            elem.attrib['Id'] = str(i)
-            sp.append(elem)
+            sp.append(SEND_PRE_BOOL_TEMPLATE.make(Id=str(i)))
+
 
+    # Three-way merge of a track changed in both branches into the
+    # track in this version with the same id, see Track.merge_with
+    def merge_track(self, ours, theirs):
+        self.ensure_id_index()
+        track = self.get_track_with_id(ours.track_id)
+        replaced = track.merge_with(ours, theirs)
+        if replaced is None:
+            return False
+        for old_elem, new_elem in replaced:
+            self.release_ids(old_elem)
+            self.pending_ids.append((track, new_elem))
+        return True
 
-    # Visit every node in the tree and document its ID
+    # Visit every node in the tree and document its ID, unless
+    # nothing has changed. Only elements merged into the tree
+    # can collide, so the index built by ensure_id_index lets
+    # the rest of the tree be skipped on later calls
     # If a duplicate ID is present, reassigned new ids
     def amend_global_id_collisions(self):
-        # COLLIDABLE_TAG
-        used_ids = []
-        duplicate_nodes = []
-        
-        def check_ids(node):
-            if node.tag in COLLIDABLE_TAG:
-                id_ = int(node.attrib['Id'])
-                if id_ in used_ids:
-                    duplicate_nodes.append(node)
-                else:
-                    used_ids.append(id_)
-            for c in list(node):
-                check_ids(c)
-
-        check_ids(self.tree)
-
-        new_id = max(used_ids)
-        for node in duplicate_nodes:
-            new_id += 1
-            node.attrib['Id'] = str(new_id)
+        if self.id_index is None:
+            self.id_index = ids.IdAllocator()
+            ids.amend_collisions(ids.tagged(self.tree, COLLIDABLE_TAGS), self.id_index)
+            return
 
+        pending, self.pending_ids = self.pending_ids, []
+        for track, elem in pending:
+            if ids.amend_collisions(ids.tagged(elem, COLLIDABLE_TAGS), self.id_index):
+                track.invalidate()
+
+    # Counts the ids in the tree as it is, before anything is merged into it
+    def ensure_id_index(self):
+        if self.id_index is None:
+            self.id_index = ids.IdAllocator()
+            for node in ids.tagged(self.tree, COLLIDABLE_TAGS):
+                self.id_index.add(int(node.attrib['Id']))
+
+    # Frees the ids used in elem, which is being taken out of the tree
+    def release_ids(self, elem):
+        self.ensure_id_index()
+        if self.pending_ids:
+            # elem could hold ids that were never added to the index
+            self.amend_global_id_collisions()
+        for node in ids.tagged(elem, COLLIDABLE_TAGS):
+            self.id_index.release(int(node.attrib['Id']))
 
     def amend_track_collisions(self):
-        track_ids = [t.track_id for t in self.tracks]
-        if len(set(track_ids)) == len(track_ids):
-            # No collisions
-            return
-        
         # Gather the tracks that need their IDs changed
-        used_ids = []
-        collided_tracks = [] 
-        for track in self.tracks:
-            if track.track_id not in used_ids:
-                used_ids.append(track.track_id)
-            else:
-                collided_tracks.append(track)
+        allocator = ids.IdAllocator()
+        collided_tracks = [t for t in self.tracks if not allocator.claim(t.track_id)]
+        if not collided_tracks:
+            # No collisions
+            return
 
-        # Get the max current track id and add one for first available
-        next_id = max(used_ids) + 1
-        for t in collided_tracks:
-            t.set_track_id(next_id)
-            next_id += 1
+        # New ids start after the max current track id
+        for t, new_id in zip(collided_tracks, allocator.block(len(collided_tracks))):
+            t.set_track_id(new_id)
+        self.reindex_tracks()
 
+    # Makes the TrackSendHolders of each track match its
+    # final_ordered_mapping. A holder already in the right
+    # place with the right value is kept, any other is
+    # replaced with a new one from the template
     def generate_sends(self):
-        tracks = self.tracks
-        returns = [t for t in tracks if t.type == TrackType.RETURN]
-        
-        # Remove current sends
-        for track in tracks:
-            track_sends = track.elem.find('DeviceChain').find('Mixer').find('Sends')
-            old_sends = [sh for sh in track_sends]
-            for sh in old_sends:
-                track_sends.remove(sh)
-
-        # Add new sends
-        for track in tracks:
-            track_sends = track.elem.find('DeviceChain').find('Mixer').find('Sends')
-            for i, rt in enumerate(returns):
-                sh_elem = ET.fromstring(TRACK_SEND_HOLDER.strip())
-                sh_elem.attrib['Id'] = str(i)
+        for track in self.tracks:
+            track_sends = track.node('Sends')
+            old_sends = list(track_sends)
+            new_sends = []
+            for i, value in enumerate(track.final_ordered_mapping):
+                if i < len(old_sends) and send_holder_matches(old_sends[i], i, value):
+                    new_sends.append(old_sends[i])
+                    continue
+                sh_elem = TRACK_SEND_HOLDER_TEMPLATE.make(Id=str(i))
                 # de activate sends if track is a return track
                 # if track.type == TrackType.RETURN:
                 #    print("deactivating send for return track")
                 #    sh_elem.find('Active').attrib['Value'] = "false"
-                sh_elem.find('Send').find('Manual').attrib['Value'] = str(track.final_ordered_mapping[i])
-                track_sends.append(sh_elem)
-                
+                sh_elem.find('Send').find('Manual').attrib['Value'] = str(value)
+                new_sends.append(sh_elem)
+
+            # Elements compare by identity, so this
+            # holds when every holder was kept
+            if new_sends == old_sends:
+                continue
+
+            old_ids = set(map(id, old_sends))
+            new_ids = set(map(id, new_sends))
+            for sh in old_sends:
+                if id(sh) not in new_ids:
+                    self.release_ids(sh)
+            track_sends[:] = new_sends
+            for sh in new_sends:
+                if id(sh) not in old_ids:
+                    self.pending_ids.append((track, sh))
+            track.invalidate()
+
 
     def return_track_count(self):
         return len([r for r in self.tracks if r.type == TrackType.RETURN])
 
-    def version_semantically_equal_to(self, other):
-        self_track_ids = [t.track_id for t in self.tracks]
-        other_track_ids = [t.track_id for t in other.tracks]
+    def conflict_with(self, track_id, ours, theirs):
+        """
+        Conflict between the tracks with track_id in ours and theirs,
+        with the differences of each from the track in this version
+        """
+        from conflict import Conflict
+
+        base_track = self.get_track_with_id(track_id)
+        base = base_track.elem
+        elems = {}
+        differences = {}
+        for side, branch in [('ours', ours), ('theirs', theirs)]:
+            track = branch.get_track_with_id(track_id)
+            elems[side] = track.elem
+            # tree_equal indexes the holders of its first element by
+            # the values of the send map
+            holders = {**base_track.send_holders(), **track.send_holders()}
+            differences[side] = diff(base, elems[side], branch.send_map_to(self), holders)
+        return Conflict(base, elems['ours'], elems['theirs'], differences)
 
-        if len(self_track_ids) != len(other_track_ids):
+    def version_semantically_equal_to(self, other):
+        if len(self.tracks) != len(other.tracks):
             return False
 
-        if set(self_track_ids) != set(other_track_ids):
+        if self.track_ids() != other.track_ids():
             return False
 
-        self_return = self.get_return_tracks()
-        other_return = other.get_return_tracks()
-
-        return_intersection_ids = [t.track_id for t in other_return if t.track_id in [b.track_id for b in self_return]]
-        # Get send ID mapping of these tracks to eachother
-        # Their send id is based on their ordering 
-        # The key will be the base send ID
-        # The value will be that send's ID in the branch track
-        send_map = {}
-        other_r_ids = [t.track_id for t in other_return]
-        self_r_ids = [t.track_id for t in self_return]
-        for i in return_intersection_ids:
-            br_loc = other_r_ids.index(i)
-            ba_loc = self_r_ids.index(i)
-            send_map[ba_loc] = br_loc
+        send_map = self.send_map_to(other)
 
         for track in self.tracks:
             other_track = other.get_track_with_id(track.track_id)
-            if not tree_equal(track.elem, other_track.elem, send_map):
+            holders = {**track.send_holders(), **other_track.send_holders()}
+            if not tree_equal(track.elem, other_track.elem, send_map, holders=holders):
                 return False
 
         return True
@@ -504,35 +608,149 @@ class Version():
 
 class Track():
 
-    def __init__(self, elem):
+    __slots__ = (
+        '_elem', '_load', 'changed', 'track_id', 'type', 'return_map', 'final_ordered_mapping',
+        '_preliminary_return_map', '_fingerprint', '_merkle', '_nodes', '_send_holders',
+    )
+
+    # Paths to the nodes of a track that are looked up repeatedly
+    NODE_PATHS = {
+        'Sends': ('DeviceChain', 'Mixer', 'Sends'),
+    }
+
+    # load, with the tag of the track and its summary, makes a track
+    # whose element is only read, by calling load, once it is used.
+    # See stream.py
+    def __init__(self, elem, summary=None, load=None, tag=None):
         # The ElementTree track node
-        self.elem = elem
-
-        # The id of the track
-        self.track_id = int(self.elem.attrib['Id'])
-
-        # The values attached to each return track, ordered
-        # Should be substituted for mapping of return track
-        # to value later
-        sends = list(self.elem.find('DeviceChain').find('Mixer').find('Sends'))
-        self.preliminary_return_map = {
-            int(send.attrib['Id']): float(send.find('Send').find('Manual').attrib['Value'])
-                for send in sends
-        }
+        self._elem = elem
+        self._load = load
+
+        # Whether the element has changed since it was read
+        self.changed = False
+
+        # Nodes looked up so far by node(), None where missing
+        self._nodes = {}
+        self._send_holders = None
+
+        if summary is None:
+            # The id of the track
+            self.track_id = int(self.elem.attrib['Id'])
+            self._preliminary_return_map = None
+            self._fingerprint = None
+        else:
+            self.track_id = summary.track_id
+            self._preliminary_return_map = summary.preliminary_return_map
+            self._fingerprint = summary.fingerprint
+        self._merkle = None
         self.return_map = None
+        self.final_ordered_mapping = None
 
         # The type of track
-        if self.elem.tag == 'MidiTrack':
+        if tag is None:
+            tag = self.elem.tag
+        if tag == 'MidiTrack':
             self.type = TrackType.MIDI
-        elif self.elem.tag == 'AudioTrack':
+        elif tag == 'AudioTrack':
             self.type = TrackType.AUDIO
         else:
             self.type = TrackType.RETURN
 
+    @property
+    def elem(self):
+        if self._elem is None:
+            self._elem = self._load()
+            self._load = None
+        return self._elem
+
+    # Whether the element has been read yet
+    def is_loaded(self):
+        return self._elem is not None
+
+    def summary(self):
+        return TrackSummary(self.track_id, self.preliminary_return_map, self.fingerprint)
+
+    # The node at NODE_PATHS[name], or None if the track has none,
+    # looked up on first use
+    def node(self, name):
+        if name not in self._nodes:
+            node = self.elem
+            for tag in self.NODE_PATHS[name]:
+                node = node.find(tag)
+                if node is None:
+                    break
+            self._nodes[name] = node
+        return self._nodes[name]
+
+    # The TrackSendHolders of the track by their Id, keyed by its
+    # Sends node as equal.tree_equal takes them, indexed on first use
+    def send_holders(self):
+        if self._send_holders is None:
+            sends = self.node('Sends')
+            self._send_holders = {} if sends is None else {sends: index_children(sends, 'TrackSendHolder', 'Id')}
+        return self._send_holders
+
+    # The values attached to each return track, ordered
+    # Should be substituted for mapping of return track
+    # to value later
+    @property
+    def preliminary_return_map(self):
+        if self._preliminary_return_map is None:
+            self._preliminary_return_map = {
+                int(send.attrib['Id']): float(send.find('Send').find('Manual').attrib['Value'])
+                    for send in self.node('Sends')
+            }
+        return self._preliminary_return_map
+
+    # Content digest of the track, see equal.fingerprint
+    # Computed once, must be invalidated whenever the element changes
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.elem, self.send_holders())
+        return self._fingerprint
+
+    # Index of the digests of every subtree, only built for
+    # tracks that need to be diffed, see merkle.py
+    @property
+    def merkle(self):
+        if self._merkle is None:
+            self._merkle = merkle.MerkleNode(self.elem)
+        return self._merkle
+
+    # Drops everything derived from the element,
+    # call whenever the element has changed
+    def invalidate(self):
+        self.changed = True
+        self._fingerprint = None
+        self._merkle = None
+        self._nodes = {}
+        self._send_holders = None
+
+    # Three-way merge of the changes made to this track in two branches
+    # Only succeeds when the branches changed separate subtrees of the
+    # track and did not set a send to different values, in which case
+    # their changes are spliced into this track's element
+    # Returns the (old, new) subtrees that were swapped, or None
+    def merge_with(self, ours, theirs):
+        return_map = sends.merge(self.return_map, ours.return_map, theirs.return_map)
+        if return_map is None:
+            return None
+
+        replacements = merkle.merge3(self.merkle, ours.merkle, theirs.merkle)
+        if replacements is None:
+            return None
+
+        replaced = merkle.apply(self.elem, replacements)
+        self.return_map = return_map
+        self.invalidate()
+        return replaced
+
     # Issues with references?
     def set_track_id(self, new_id):
         self.track_id = new_id
         self.elem.attrib['Id'] = str(new_id)
+        self.invalidate()
 
     # mapping of return track objects to values
     def set_return_map(self, mapping):
@@ -540,6 +758,17 @@ class Track():
     
 
 
+# Whether the TrackSendHolder sh is the index'th send, set to value
+def send_holder_matches(sh, index, value):
+    if sh.tag != 'TrackSendHolder' or sh.attrib.get('Id') != str(index):
+        return False
+    manual = sh.find('Send/Manual')
+    return manual is not None and float(manual.attrib['Value']) == value
+
+def remove_if_exists(path):
+    if os.path.exists(path):
+        os.remove(path)
+
 class TrackType(Enum):
     MIDI = 0
     AUDIO = 1
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import select
+import time
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+# Used when the platform has neither kqueue nor inotify
+POLL_INTERVAL = 0.05
+
+# Seconds a resolution that is not valid JSON is left unchanged
+# before it is taken as invalid rather than still being written
+SETTLE_TIME = 2.0
+
+
+class ResolutionTimeout(Exception):
+    pass
+
+
+def wait_for_file(path, timeout=None):
+    """
+    Blocks until path exists, waking up as soon as its folder
+    changes rather than polling where the platform allows.
+    Returns False if timeout seconds pass first
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    watcher = _watcher_for(os.path.dirname(path) or '.')
+    try:
+        # The watch is in place before checking, so a file created
+        # in between is not missed
+        while not os.path.exists(path):
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+            watcher.wait(remaining)
+        return True
+    finally:
+        watcher.close()
+
+
+def wait_for_json(path, timeout=None):
+    """
+    Waits for path with wait_for_file and loads it as JSON, giving
+    the writer time to finish if the file is not complete yet.
+    Raises ResolutionTimeout if timeout seconds pass first, or if
+    the file stays invalid for SETTLE_TIME seconds
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    if not wait_for_file(path, timeout):
+        raise ResolutionTimeout('No resolution was written to ' + path)
+    # The size and modification time of the file, and when they last changed
+    last_state = None
+    last_change = None
+    while True:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except ValueError:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                raise ResolutionTimeout('Incomplete resolution written to ' + path)
+            stat = os.stat(path)
+            state = (stat.st_size, stat.st_mtime_ns)
+            if state != last_state:
+                last_state, last_change = state, now
+            elif now - last_change >= SETTLE_TIME:
+                raise ResolutionTimeout('Invalid resolution written to ' + path)
+            time.sleep(POLL_INTERVAL)
+
+
+def _watcher_for(folder):
+    if hasattr(select, 'kqueue'):
+        return _KqueueWatcher(folder)
+    try:
+        return _InotifyWatcher(folder)
+    except OSError:
+        return _PollingWatcher()
+
+
+class _KqueueWatcher():
+
+    def __init__(self, folder):
+        self.fd = os.open(folder, os.O_RDONLY)
+        self.kq = select.kqueue()
+        event = select.kevent(
+            self.fd,
+            filter=select.KQ_FILTER_VNODE,
+            flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+            fflags=select.KQ_NOTE_WRITE,
+        )
+        self.kq.control([event], 0, 0)
+
+    def wait(self, timeout):
+        self.kq.control(None, 1, timeout)
+
+    def close(self):
+        self.kq.close()
+        os.close(self.fd)
+
+
+class _InotifyWatcher():
+
+    def __init__(self, folder):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed')
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # The events themselves are not needed, the caller checks
+            # for the file again
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _PollingWatcher():
+
+    def wait(self, timeout):
+        time.sleep(POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL))
+
+    def close(self):
+        pass
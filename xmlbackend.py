@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+The ElementTree implementation used throughout the driver.
+
+lxml is used when it is installed, for its faster parsing, copying
+and tag searches, otherwise the standard library's ElementTree. Set
+ALS_MERGE_XML to 'lxml' or 'etree' to choose one. Modules import ET
+from here rather than either library, and use the functions below
+where the two behave differently
+"""
+import os
+
+BACKEND_ENV = 'ALS_MERGE_XML'
+
+LXML = 'lxml'
+ETREE = 'etree'
+
+
+def _load(name):
+    if name == LXML:
+        from lxml import etree
+        return etree
+    if name == ETREE:
+        import xml.etree.ElementTree as etree
+        return etree
+    raise ValueError('Unknown XML backend ' + repr(name) + ', use ' + LXML + ' or ' + ETREE)
+
+
+NAME = os.environ.get(BACKEND_ENV)
+if NAME:
+    ET = _load(NAME)
+else:
+    try:
+        NAME = LXML
+        ET = _load(NAME)
+    except ImportError:
+        NAME = ETREE
+        ET = _load(NAME)
+
+if NAME == LXML:
+    # Sets can have more nodes than lxml allows by default
+    _parser = ET.XMLParser(huge_tree=True, remove_comments=True, remove_pis=True)
+else:
+    _parser = None
+
+
+def parse(source):
+    """
+    Parses a file name or binary file object, returning the root element
+    """
+    return ET.parse(source, _parser).getroot()
+
+
+def fromstring(data):
+    return ET.fromstring(data, _parser)
+
+
+def iter_tags(root, tags):
+    """
+    Iterates over every element below and including root whose tag
+    is in tags, in document order
+    """
+    if NAME == LXML:
+        # Filtered in C
+        return root.iter(*tags)
+    return (node for node in root.iter() if node.tag in tags)
+
+
+def attachable(elem):
+    """
+    elem, or with lxml a copy of it if it is already in a tree, as
+    adding it to another would take it out of the first
+    """
+    if NAME == LXML and elem.getparent() is not None:
+        import copy
+        return copy.deepcopy(elem)
+    return elem
+
+
+def shallow_copy(elem):
+    """
+    Copies elem with the same children. The standard library shares
+    the children with the original, lxml cannot as an element only
+    has one parent, so they are copied too
+    """
+    # copy.copy would share the attrib dict with the original
+    new = elem.makeelement(elem.tag, dict(elem.attrib))
+    new.text = elem.text
+    new.tail = elem.tail
+    if NAME == LXML:
+        import copy
+        new.extend(copy.deepcopy(child) for child in elem)
+    else:
+        new.extend(elem)
+    return new